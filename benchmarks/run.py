@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import datetime
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+KEY_PARAMS = [
+    ('rsa-2048', {'key_type': 'rsa', 'key_size': 2048, 'key_public_exponent': 65537}),
+    ('rsa-4096', {'key_type': 'rsa', 'key_size': 4096, 'key_public_exponent': 65537}),
+    ('ecdsa-p256', {'key_type': 'ecdsa-p256'}),
+    ('ed25519', {'key_type': 'ed25519'}),
+]
+
+
+def measure(fn, repeat, setup=None):
+    timings = []
+    for i in range(repeat):
+        if setup:
+            setup()
+        started_at = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started_at)
+
+    return {
+        'repeat': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings),
+        'max': max(timings),
+    }
+
+
+def cert_info(cn, key_params):
+    from myca import x509
+
+    since = datetime.datetime.utcnow()
+    info = x509.CertInfo(key_params)
+    info.subj_cn = cn
+    info.cert_validate_since = since
+    info.cert_validate_till = since + datetime.timedelta(days=365)
+    info.san_dns_names = [cn + '.example.com']
+    info.ku_web_server_auth = True
+    return info
+
+
+def bench_x509(results, repeat):
+    from myca import x509
+
+    for name, key_params in KEY_PARAMS:
+        # RSA-4096 key generation takes around a second, so it gets fewer rounds
+        rounds = max(1, repeat // 10) if name == 'rsa-4096' else repeat
+        ca_pair = x509.issue_certificate(cert_info('ca', key_params))
+        leaf_pair = x509.issue_certificate(cert_info('leaf', key_params), ca_pair)
+
+        results['x509.issue_certificate.ca.' + name] = measure(
+            lambda: x509.issue_certificate(cert_info('ca', key_params)), rounds)
+        results['x509.issue_certificate.leaf.' + name] = measure(
+            lambda: x509.issue_certificate(cert_info('leaf', key_params), ca_pair), rounds, setup=x509.cache.clear)
+
+        for cached in False, True:
+            suffix = '.{}.{}'.format(name, 'warm' if cached else 'cold')
+            setup = None if cached else x509.cache.clear
+
+            results['x509.load_certificate_info' + suffix] = measure(
+                lambda: x509.load_certificate_info(leaf_pair, reissue=True), repeat, setup=setup)
+            results['x509.verify_certificate_chain' + suffix] = measure(
+                lambda: x509.verify_certificate_chain(leaf_pair[0], [ca_pair[0]]), repeat, setup=setup)
+            results['x509.does_keys_match' + suffix] = measure(
+                lambda: x509.does_keys_match(leaf_pair), repeat, setup=setup)
+            results['x509.get_certificate_text' + suffix] = measure(
+                lambda: x509.get_certificate_text(leaf_pair[0]), repeat, setup=setup)
+
+
+def seed(count):
+    from myca import models, x509, issuance
+
+    db = models.db
+    db.drop_all()
+    db.create_all()
+
+    root = models.Identity(name='root')
+    db.session.add(root)
+    issuance.issue(root, cert_info('root', {'key_type': 'ecdsa-p256'}))
+    db.session.commit()
+
+    ca_signer = x509.CaSigner(root.pair.as_tuple)
+    for offset in range(0, count, 1000):
+        identities = []
+        for i in range(offset, min(count, offset + 1000)):
+            identity = models.Identity(name='leaf{}'.format(i), issuer=root)
+            cert, key = x509.issue_certificate(cert_info(identity.name, {'key_type': 'ecdsa-p256'}),
+                                               ca_signer=ca_signer)
+            identity.pair = models.Pair(cert, key)
+            identities.append(identity)
+        db.session.add_all(identities)
+        db.session.commit()
+
+    return db.session.query(models.Identity.id).filter(models.Identity.issuer_id == root.id).first()[0]
+
+
+def bench_views(results, sizes, repeat):
+    from myca import x509
+    from myca.app import app
+
+    client = app.test_client()
+
+    def request(method, url, **kwargs):
+        response = getattr(client, method)(url, **kwargs)
+        assert response.status_code < 400, '{} {}: {}'.format(method.upper(), url, response.status_code)
+
+    for size in sizes:
+        with app.app_context():
+            leaf_id = seed(size)
+
+        prefix = 'views.{}.'.format(size)
+        results[prefix + 'identity.list'] = measure(
+            lambda: request('get', '/identity/'), repeat, setup=x509.cache.clear)
+        results[prefix + 'identity.list.sorted'] = measure(
+            lambda: request('get', '/identity/?sort=3&desc=1'), repeat, setup=x509.cache.clear)
+        results[prefix + 'identity.details'] = measure(
+            lambda: request('get', '/identity/details/?id={}'.format(leaf_id), follow_redirects=True), repeat,
+            setup=x509.cache.clear)
+        results[prefix + 'identity.reissue'] = measure(
+            lambda: request('post', '/identity/reissue/', data={'id': leaf_id}), repeat)
+
+
+def get_meta():
+    import cryptography
+    import OpenSSL
+    import sqlalchemy
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, check=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'created_at': datetime.datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'cryptography': cryptography.__version__,
+        'pyopenssl': OpenSSL.__version__,
+        'sqlalchemy': sqlalchemy.__version__,
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+
+    for name, stats in sorted(results.items()):
+        if name not in baseline:
+            continue
+        ratio = stats['median'] / baseline[name]['median']
+        print('{:<60} {:>10.3f}ms {:>10.3f}ms {:>7.2f}x'.format(
+            name, baseline[name]['median'] * 1000, stats['median'] * 1000, ratio), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark x509 operations and admin views')
+    parser.add_argument('-o', '--output', default='-', help='JSON results file (defaults to stdout)')
+    parser.add_argument('-r', '--repeat', type=int, default=20, help='Rounds per benchmark')
+    parser.add_argument('-s', '--sizes', default='100,1000,10000',
+                        help='Comma separated numbers of seeded identities for view benchmarks')
+    parser.add_argument('--only', choices=['x509', 'views'], default=None, help='Run only one group')
+    parser.add_argument('--compare', metavar='JSON', default=None, help='Print median ratios against a baseline')
+    args = parser.parse_args()
+
+    # measure real key generation and an isolated database, whatever the environment says
+    os.environ['KEY_POOL_SIZE'] = '0'
+    os.environ['ASYNC_ISSUANCE'] = '0'
+    db_file = tempfile.NamedTemporaryFile(prefix='myca-bench-', suffix='.db', delete=False)
+    db_file.close()
+    os.environ['DATABASE_URI'] = 'sqlite:///' + db_file.name
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+    results = {}
+    try:
+        if args.only in (None, 'x509'):
+            bench_x509(results, args.repeat)
+        if args.only in (None, 'views'):
+            bench_views(results, [int(size) for size in args.sizes.split(',')], args.repeat)
+    finally:
+        os.unlink(db_file.name)
+
+    report = {'meta': get_meta(), 'results': results}
+    if args.output == '-':
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
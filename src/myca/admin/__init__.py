@@ -3,8 +3,13 @@ from flask_admin import Admin
 from myca import models
 from .identity import IdentityView
 from .pair import PairView
+from .job import JobView
+from .pair_archive import PairArchiveView
 
 
 admin = Admin(name='MyCA', url='/', template_mode='bootstrap3')
 admin.add_view(IdentityView(models.Identity, models.db.session))
 admin.add_view(PairView(models.Pair, models.db.session))
+admin.add_view(JobView(models.Job, models.db.session))
+admin.add_view(PairArchiveView(models.PairArchive, models.db.session, endpoint='pair_archive',
+                               url='/pair-archive/'))
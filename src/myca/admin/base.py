@@ -1,5 +1,14 @@
 from flask_admin.contrib.sqla import ModelView as BaseModelView
 
+from myca import models
+
 
 class ModelView(BaseModelView):
     can_view_details = True
+    replica_views = {'index_view', 'details_view', 'export', 'download_view'}
+
+    def _handle_view(self, name, **kwargs):
+        models.db.remember_writes()
+        if name in self.replica_views:
+            models.db.use_replica()
+        return super()._handle_view(name, **kwargs)
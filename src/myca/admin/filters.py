@@ -0,0 +1,28 @@
+import datetime
+
+from flask_admin.babel import lazy_gettext
+from flask_admin.contrib.sqla.filters import BaseSQLAFilter
+
+from myca import models, expiry
+
+
+class ExpiresWithinFilter(BaseSQLAFilter):
+    def __init__(self, name='Expires', options=None, data_type=None):
+        super().__init__(models.Identity.id, name, options, data_type)
+
+    def validate(self, value):
+        try:
+            int(value)
+        except ValueError:
+            return False
+        return True
+
+    def clean(self, value):
+        return int(value)
+
+    def apply(self, query, value, alias=None):
+        till = datetime.datetime.utcnow() + datetime.timedelta(days=value)
+        return query.filter(self.column.in_(expiry.query_expiring_ids(till)))
+
+    def operation(self):
+        return lazy_gettext('within days')
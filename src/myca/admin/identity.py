@@ -1,18 +1,20 @@
 import datetime
 
-from flask import request, flash, redirect
+from flask import request, flash, redirect, abort, Response, stream_with_context
 from flask_admin import expose
 from flask_admin.form import rules
 from flask_admin.helpers import get_redirect_target, get_form_data
 from flask_admin.model.template import macro
 from flask_admin.model.fields import InlineFieldList
+from flask_admin.contrib.sqla.fields import QuerySelectField
 import wtforms
 from wtforms import fields
 from wtforms import validators
 from sqlalchemy.exc import IntegrityError
 
-from myca import x509, models
+from myca import config, x509, models, issuance, bulk, importing, export, k8s
 from .base import ModelView
+from .filters import ExpiresWithinFilter
 
 required = [validators.DataRequired()]
 
@@ -31,12 +33,57 @@ class ImportForm(wtforms.Form):
     key = fields.TextAreaField('Private key PEM data', validators=required)
 
 
+class BulkImportForm(wtforms.Form):
+    bundle = fields.FileField('PEM bundle or tar archive', validators=required,
+                              description='Certificates and their private keys in any order')
+
+
+class BulkReissueForm(wtforms.Form):
+    issuer = QuerySelectField('Issuer', description='Reissue this identity and all identities issued by it',
+                              query_factory=lambda: models.Identity.query.order_by(models.Identity.name),
+                              allow_blank=True)
+    expiring_days = fields.IntegerField('Expiring within days', validators=[validators.Optional()],
+                                        description='Reissue certificates expiring within this number of days')
+
+    def validate(self):
+        if not super().validate():
+            return False
+        if not self.issuer.data and self.expiring_days.data is None:
+            self.issuer.errors.append('Either issuer or expiration window is required')
+            return False
+        return True
+
+
 class IdentityView(ModelView):
     column_list = [
         'issuer',
         'name',
+        'current_pair.serial',
+        'current_pair.not_after',
         'status',
     ]
+    column_labels = {
+        'current_pair.subject_cn': 'CN',
+        'current_pair.serial': 'Serial',
+        'current_pair.fingerprint': 'Fingerprint',
+        'current_pair.not_after': 'Expires',
+        'current_pair.is_ca': 'CA',
+    }
+    column_sortable_list = [
+        'name',
+        ('issuer', 'issuer.name'),
+        'current_pair.serial',
+        'current_pair.not_after',
+    ]
+    column_filters = [
+        'name',
+        'current_pair.subject_cn',
+        'current_pair.serial',
+        'current_pair.fingerprint',
+        'current_pair.not_after',
+        'current_pair.is_ca',
+        ExpiresWithinFilter('Expires'),
+    ]
     list_template = 'admin/identity_list.html'
     column_formatters = {
         'status': macro('render_status'),
@@ -46,8 +93,20 @@ class IdentityView(ModelView):
         'name',
         'issues',
         'pairs',
+        'jobs',
+        'current_pair',
+        'archived_pairs',
+        'synced_pair_id',
     ]
 
+    form_args = {
+        'k8s_secret': {
+            'label': 'Secret',
+            'description': 'Kubernetes Secret kept in sync with the current certificate, as [namespace/]name',
+            'validators': [validators.Optional(), validators.Regexp(k8s.SECRET_REF_RE, message='Invalid Secret name')],
+        },
+    }
+
     form_extra_fields = {
         'subj_cn': fields.StringField('CN', description='Common Name', validators=required),
         'subj_c': fields.StringField('C', description='Country'),
@@ -71,8 +130,17 @@ class IdentityView(ModelView):
         'ku_web_server_auth': fields.BooleanField('Web server auth', description='TLS Web Server Authentication'),
         'ku_web_client_auth': fields.BooleanField('Web client auth', description='TLS Web Client Authentication'),
 
-        'key_size': fields.IntegerField('Size', default=2048),
-        'key_public_exponent': fields.IntegerField('Public exponent', default=65537),
+        'key_type': fields.SelectField('Type', choices=[
+            ('rsa', 'RSA'),
+            ('ecdsa-p256', 'ECDSA P-256'),
+            ('ecdsa-p384', 'ECDSA P-384'),
+            ('ecdsa-p521', 'ECDSA P-521'),
+            ('ed25519', 'Ed25519'),
+        ], default='rsa'),
+        'key_size': fields.IntegerField('Size', default=2048, description='RSA only',
+                                        validators=[validators.Optional()]),
+        'key_public_exponent': fields.IntegerField('Public exponent', default=65537, description='RSA only',
+                                                   validators=[validators.Optional()]),
     }
 
     form_rules = [
@@ -100,45 +168,51 @@ class IdentityView(ModelView):
             'ku_web_client_auth',
         ], 'Key Usage'),
         rules.FieldSet([
+            'key_type',
             'key_size',
             'key_public_exponent',
         ], 'Key Settings'),
+        rules.FieldSet([
+            'k8s_secret',
+        ], 'Kubernetes'),
     ]
 
+    def get_list(self, *args, **kwargs):
+        count, data = super().get_list(*args, **kwargs)
+        if isinstance(data, list):
+            models.Identity.load_pair_errors(data)
+            models.Identity.prefetch_jobs(data)
+        return count, data
+
     def create_model(self, *args, **kwargs):
         with self.session.no_autoflush:
             return super().create_model(*args, **kwargs)
 
     def on_model_change(self, form, model, is_created):
         data = x509.CertInfo(form.data)
-
-        if data.issuer:
-            pair = models.Pair(*x509.issue_certificate(data, data.issuer.pair.as_tuple))
-        else:
-            pair = models.Pair(*x509.issue_certificate(data))
-
-        model.pair = pair
+        issuance.request_issue(model, data)
         model.name = data.subj_cn
 
     @expose('/reissue/', methods=['POST'])
     def reissue_view(self):
         model = self.get_one(request.values.get('id'))
-        info = x509.load_certificate_info(model.pair.as_tuple, reissue=True)
+        return_url = get_redirect_target() or self.get_url('.index_view')
 
-        if model.issuer:
-            pair = models.Pair(*x509.issue_certificate(info, model.issuer.pair.as_tuple))
-        else:
-            pair = models.Pair(*x509.issue_certificate(info))
+        if model.pair is None:
+            flash('The identity certificate is not issued yet', 'error')
+            return redirect(return_url)
 
-        model.pair = pair
+        result = issuance.request_reissue(model)
 
         self.session.commit()
-        return_url = get_redirect_target() or self.get_url('.index_view')
-        flash('The identity certificate was successfully reissued', 'success')
+        if isinstance(result, models.Job):
+            flash('The identity certificate reissue was queued', 'success')
+        else:
+            flash('The identity certificate was successfully reissued', 'success')
         return redirect(return_url)
 
     def edit_form(self, obj=None):
-        if obj:
+        if obj and obj.pair:
             info = x509.load_certificate_info(obj.pair.as_tuple, reissue=True)
             for k, v in info.as_dict().items():
                 if not hasattr(obj, k):
@@ -149,6 +223,11 @@ class IdentityView(ModelView):
     def details_view(self):
         model = self.get_one(request.values.get('id'))
         return_url = get_redirect_target() or self.get_url('.index_view')
+
+        if model.pair is None:
+            flash('The identity certificate is not issued yet', 'error')
+            return redirect(return_url)
+
         return redirect(self.get_url('pair.details_view', id=model.pair.id, url=return_url))
 
     @expose('/import/', methods=['GET', 'POST'])
@@ -158,36 +237,13 @@ class IdentityView(ModelView):
 
         if self.validate_form(form):
             pair_tuple = form.data['cert'].encode('ascii'), form.data['key'].encode('ascii')
-            info = x509.load_certificate_info(pair_tuple)
 
-            if not x509.does_keys_match(pair_tuple):
-                flash('Failed to import identity: keys does not match.', 'error')
+            try:
+                identity = importing.import_pair(pair_tuple)
+            except importing.ImportFailed as e:
+                flash('Failed to import identity: {}'.format(e), 'error')
                 return redirect(return_url)
 
-            identity = models.Identity()
-            identity.name = info.subj_cn
-
-            if not info.self_signed:
-                def find_issuer():
-                    for issuer in models.Identity.query.filter_by(name=info.issuer_cn):
-                        cert_chain = issuer.get_cert_chain()
-                        try:
-                            x509.verify_certificate_chain(pair_tuple[0], cert_chain)
-                        except x509.InvalidCertificate:
-                            pass
-                        else:
-                            return issuer
-
-                identity.issuer = find_issuer()
-                if not identity.issuer:
-                    flash('Failed to import identity: issuer identity not found.', 'error')
-                    return redirect(return_url)
-
-            self.session.add(identity)
-            pair = models.Pair(*pair_tuple)
-            pair.identity = identity
-            self.session.add(pair)
-
             try:
                 self.session.commit()
             except IntegrityError:
@@ -200,3 +256,63 @@ class IdentityView(ModelView):
         return self.render('admin/identity_import.html',
                            form=form,
                            return_url=return_url)
+
+    @expose('/bulk-reissue/', methods=['GET', 'POST'])
+    def bulk_reissue_view(self):
+        return_url = get_redirect_target() or self.get_url('.index_view')
+        form = BulkReissueForm(get_form_data())
+
+        if self.validate_form(form):
+            issuer = form.data['issuer']
+            expiring_days = form.data['expiring_days']
+            identities = bulk.select(issuer.id if issuer else None,
+                                     expiring_within=datetime.timedelta(days=expiring_days)
+                                     if expiring_days is not None else None)
+            # signing runs in the job worker, a large subtree would not fit into a request
+            report = bulk.enqueue(identities)
+
+            flash('Bulk reissue queued: {}'.format(report), 'success')
+            for failure in report.failed:
+                flash('{name}: {error}'.format(**failure), 'error')
+            if not config.async_issuance:
+                flash('Queued jobs are processed by "python -m myca worker"', 'info')
+            return redirect(self.get_url('job.index_view'))
+
+        return self.render('admin/identity_bulk_reissue.html',
+                           form=form,
+                           return_url=return_url)
+
+    @expose('/bulk-import/', methods=['GET', 'POST'])
+    def bulk_import_view(self):
+        return_url = get_redirect_target() or self.get_url('.index_view')
+        form = BulkImportForm(get_form_data())
+
+        if self.validate_form(form):
+            bundle = form.data['bundle']
+            report = importing.import_many(importing.iter_fileobj(bundle.stream, bundle.filename))
+
+            if report.failed:
+                flash('Bulk import finished with errors: {}'.format(report), 'error')
+                for failure in report.failed:
+                    flash('{source} {name}: {error}'.format(**failure), 'error')
+            else:
+                flash('Bulk import finished: {}'.format(report), 'success')
+            return redirect(return_url)
+
+        return self.render('admin/identity_import.html',
+                           form=form,
+                           return_url=return_url)
+
+    @expose('/download/')
+    def download_view(self):
+        export_format = request.args.get('format', 'tgz')
+        if export_format not in export.FORMATS:
+            abort(400)
+
+        issuer_id = request.args.get('issuer', type=int)
+        mimetype, extension = export.FORMATS[export_format]
+        chunks = export.stream(export_format, issuer_id=issuer_id, namespace=request.args.get('namespace'))
+
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+            'Content-Disposition': 'attachment; filename=myca.{}'.format(extension),
+        })
@@ -0,0 +1,12 @@
+from .base import ModelView
+
+
+class JobView(ModelView):
+    can_create = False
+    can_edit = False
+
+    column_list = ['identity', 'kind', 'status', 'error', 'created_at', 'started_at', 'finished_at']
+    column_filters = ['identity_id', 'kind', 'status']
+    column_default_sort = ('id', True)
+    column_exclude_list = ['data']
+    column_details_exclude_list = ['data']
@@ -2,20 +2,20 @@ from flask import request, flash, redirect
 from flask_admin import expose
 from flask_admin.helpers import get_redirect_target
 
-from myca import models
+from myca import x509, models
 from .base import ModelView
 
 
-class PairView(ModelView):
+# shared by current and archived pairs, any of them can be made the current pair again
+class BasePairView(ModelView):
     can_create = False
     can_delete = False
     can_edit = False
 
-    column_list = ['issued_at']
     column_filters = ['identity_id']
     column_default_sort = ('issued_at', True)
-    list_template = 'admin/pair_list.html'
     details_template = 'admin/pair_details.html'
+    return_endpoint = 'identity.index_view'
 
     def is_visible(self):
         return False
@@ -23,10 +23,28 @@ class PairView(ModelView):
     @expose('/revert/', methods=['POST'])
     def revert_view(self):
         old_pair = self.get_one(request.values.get('id'))
-        new_pair = models.Pair(old_pair.cert, old_pair.key)
-        new_pair.identity_id = old_pair.identity_id
-        self.session.add(new_pair)
+        old_pair.identity.pair = models.Pair(old_pair.cert, old_pair.key)
         self.session.commit()
-        return_url = get_redirect_target() or self.get_url('identity.index_view')
+        return_url = get_redirect_target() or self.get_url(self.return_endpoint)
         flash('The certificate was successfully reverted', 'success')
         return redirect(return_url)
+
+
+class PairView(BasePairView):
+    column_list = ['issued_at', 'serial', 'not_before', 'not_after', 'revoked_at', 'revocation_reason']
+    list_template = 'admin/pair_list.html'
+
+    @expose('/revoke/', methods=['POST'])
+    def revoke_view(self):
+        pair = self.get_one(request.values.get('id'))
+        reason = request.values.get('reason', 'unspecified')
+        return_url = get_redirect_target() or self.get_url(self.return_endpoint)
+
+        if reason not in x509.REVOCATION_REASONS:
+            flash('Unknown revocation reason', 'error')
+            return redirect(return_url)
+
+        pair.revoke(reason)
+        self.session.commit()
+        flash('The certificate was successfully revoked', 'success')
+        return redirect(return_url)
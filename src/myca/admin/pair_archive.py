@@ -0,0 +1,7 @@
+from .pair import BasePairView
+
+
+class PairArchiveView(BasePairView):
+    column_list = ['issued_at', 'archived_at', 'serial', 'not_before', 'not_after', 'revoked_at',
+                   'revocation_reason']
+    list_template = 'admin/pair_archive_list.html'
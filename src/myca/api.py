@@ -0,0 +1,326 @@
+import datetime
+import ipaddress
+
+from flask import Blueprint, request, jsonify, abort, make_response
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+
+from myca import x509, models, issuance, keypool, k8s
+
+blueprint = Blueprint('api', __name__)
+
+db = models.db
+Identity = models.Identity
+Pair = models.Pair
+PairArchive = models.PairArchive
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+DATETIME_FORMATS = ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']
+STRING_FIELDS = ['subj_cn', 'subj_c', 'subj_o', 'subj_ou', 'subj_dnq', 'subj_st', 'subj_sn']
+RSA_KEY_SIZES = range(1024, 16385)
+RSA_PUBLIC_EXPONENTS = [3, 65537]
+
+
+@blueprint.before_request
+def route_reads():
+    # clients that need to read their own writes ask for a fresh response
+    if request.method in ('GET', 'HEAD') and not request.cache_control.no_cache:
+        db.use_replica()
+
+
+@blueprint.errorhandler(HTTPException)
+def handle_http_error(e):
+    response = jsonify(error=e.description)
+    response.status_code = e.code
+    return response
+
+
+def get_int_arg(name, default=None, minimum=0):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        abort(400, '{} must be an integer'.format(name))
+    if value < minimum:
+        abort(400, '{} must be at least {}'.format(name, minimum))
+    return value
+
+
+def get_limit():
+    return min(get_int_arg('limit', DEFAULT_LIMIT, minimum=1), MAX_LIMIT)
+
+
+def validate_info_data(data):
+    for name in STRING_FIELDS:
+        if data.get(name) is not None and not isinstance(data[name], str):
+            abort(400, '{} must be a string'.format(name))
+
+    key_type = data.get('key_type') or 'rsa'
+    if key_type not in keypool.KEY_TYPES:
+        abort(400, 'key_type must be one of: {}'.format(', '.join(keypool.KEY_TYPES)))
+    if key_type == 'rsa':
+        key_size = data.get('key_size')
+        if key_size is not None and (not isinstance(key_size, int) or key_size not in RSA_KEY_SIZES):
+            abort(400, 'key_size must be an integer between {} and {}'.format(RSA_KEY_SIZES.start,
+                                                                             RSA_KEY_SIZES.stop - 1))
+        exponent = data.get('key_public_exponent')
+        if exponent is not None and (not isinstance(exponent, int) or exponent not in RSA_PUBLIC_EXPONENTS):
+            abort(400, 'key_public_exponent must be one of: {}'.format(', '.join(map(str, RSA_PUBLIC_EXPONENTS))))
+
+    for name in ('san_dns_names', 'san_ips'):
+        value = data.get(name)
+        if value is not None and (not isinstance(value, list) or not all(isinstance(v, str) for v in value)):
+            abort(400, '{} must be a list of strings'.format(name))
+    for ip in data.get('san_ips') or []:
+        try:
+            ipaddress.ip_address(ip)
+        except ValueError:
+            abort(400, 'Invalid IP address: {}'.format(ip))
+
+    issuer_id = data.get('issuer_id')
+    if issuer_id is not None and (not isinstance(issuer_id, int) or isinstance(issuer_id, bool)):
+        abort(400, 'issuer_id must be an integer')
+
+
+def parse_datetime(value):
+    for datetime_format in DATETIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, datetime_format)
+        except (ValueError, TypeError):
+            pass
+    abort(400, 'Invalid datetime: {}'.format(value))
+
+
+def format_datetime(value):
+    return value.isoformat() if value else None
+
+
+def not_modified(etag):
+    if etag is not None and etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+
+
+def with_etag(response, etag):
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+def serialize_pair_summary(pair):
+    return {
+        'id': pair.id,
+        'identity_id': pair.identity_id,
+        'issued_at': format_datetime(pair.issued_at),
+        'serial': pair.serial,
+        'subject_cn': pair.subject_cn,
+        'fingerprint': pair.fingerprint,
+        'not_before': format_datetime(pair.not_before),
+        'not_after': format_datetime(pair.not_after),
+        'is_ca': pair.is_ca,
+        'revoked_at': format_datetime(pair.revoked_at),
+        'revocation_reason': pair.revocation_reason,
+    }
+
+
+def serialize_pair(pair, chain=()):
+    data = serialize_pair_summary(pair)
+    data['cert'] = pair.cert_str
+    data['key'] = pair.key_str
+    data['chain'] = b''.join(x509.cert_to_pem(cert) for cert in chain).decode('ascii')
+    return data
+
+
+def serialize_identity_row(row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'issuer_id': row.issuer_id,
+        'current_pair_id': row.current_pair_id,
+        'serial': row.serial,
+        'not_after': format_datetime(row.not_after),
+    }
+
+
+def serialize_identity(identity):
+    data = {
+        'id': identity.id,
+        'name': identity.name,
+        'issuer_id': identity.issuer_id,
+        'current_pair_id': identity.current_pair_id,
+        'k8s_secret': identity.k8s_secret,
+        'pair': None,
+    }
+    if identity.pair:
+        data['pair'] = serialize_pair(identity.pair, identity.get_cert_chain()[1:])
+    return data
+
+
+def get_identity_etag(identity_id):
+    row = db.session.query(Identity.current_pair_id).filter(Identity.id == identity_id).first()
+    if row is None:
+        abort(404, 'Identity not found')
+    return str(row.current_pair_id) if row.current_pair_id else None
+
+
+def get_identity(identity_id):
+    identity = Identity.query.get(identity_id)
+    if identity is None:
+        abort(404, 'Identity not found')
+    return identity
+
+
+def issuance_response(identity, result):
+    db.session.commit()
+    if isinstance(result, models.Job):
+        response = jsonify(id=identity.id, job_id=result.id, status=result.status)
+        response.status_code = 202
+        return response
+
+    Identity.prefetch_pairs([identity])
+    response = jsonify(serialize_identity(identity))
+    response.status_code = 201
+    return with_etag(response, str(identity.current_pair_id))
+
+
+@blueprint.route('/identities')
+def list_identities():
+    query = db.session.query(Identity.id, Identity.name, Identity.issuer_id, Identity.current_pair_id,
+                             Pair.serial, Pair.not_after) \
+        .outerjoin(Pair, Identity.current_pair_id == Pair.id)
+
+    after = get_int_arg('after')
+    if after is not None:
+        query = query.filter(Identity.id > after)
+    issuer_id = get_int_arg('issuer')
+    if issuer_id is not None:
+        query = query.filter(Identity.issuer_id == issuer_id)
+
+    limit = get_limit()
+    rows = query.order_by(Identity.id).limit(limit).all()
+
+    return jsonify(items=[serialize_identity_row(row) for row in rows],
+                   next=rows[-1].id if len(rows) == limit else None)
+
+
+@blueprint.route('/identities', methods=['POST'])
+def create_identity():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, 'JSON object is required')
+    if not data.get('subj_cn'):
+        abort(400, 'subj_cn is required')
+    validate_info_data(data)
+    if data.get('k8s_secret') and not k8s.SECRET_REF_RE.match(data['k8s_secret']):
+        abort(400, 'k8s_secret must be [namespace/]name')
+
+    since = parse_datetime(data['cert_validate_since']) if data.get('cert_validate_since') \
+        else datetime.datetime.utcnow()
+    till = parse_datetime(data['cert_validate_till']) if data.get('cert_validate_till') \
+        else since.replace(year=since.year + 1)
+
+    info = x509.CertInfo({k: v for k, v in data.items() if k in x509.CertInfo().__dict__})
+    info.cert_validate_since = since
+    info.cert_validate_till = till
+    info.issuer = get_identity(data['issuer_id']) if data.get('issuer_id') is not None else None
+    if info.issuer is not None and info.issuer.pair is None:
+        abort(400, 'Issuer certificate is not issued yet')
+    if till <= since:
+        abort(400, 'cert_validate_till must be after cert_validate_since')
+
+    identity = Identity()
+    identity.name = info.subj_cn
+    identity.issuer = info.issuer
+    identity.k8s_secret = data.get('k8s_secret') or None
+    db.session.add(identity)
+
+    try:
+        result = issuance.request_issue(identity, info)
+        return issuance_response(identity, result)
+    except IntegrityError:
+        db.session.rollback()
+        abort(409, 'Identity with same name already exists')
+
+
+@blueprint.route('/identities/<int:identity_id>')
+def get_identity_view(identity_id):
+    etag = get_identity_etag(identity_id)
+    response = not_modified(etag)
+    if response:
+        return response
+
+    identity = get_identity(identity_id)
+    Identity.prefetch_pairs([identity])
+    return with_etag(jsonify(serialize_identity(identity)), etag)
+
+
+@blueprint.route('/identities/<int:identity_id>/reissue', methods=['POST'])
+def reissue_identity(identity_id):
+    identity = get_identity(identity_id)
+    if identity.pair is None:
+        abort(409, 'Identity certificate is not issued yet')
+    return issuance_response(identity, issuance.request_reissue(identity))
+
+
+@blueprint.route('/identities/<int:identity_id>/pairs')
+def list_identity_pairs(identity_id):
+    get_identity_etag(identity_id)
+
+    # archived pairs keep their IDs, so paging can continue from the pair table into the archive
+    model = PairArchive if get_int_arg('archived') else Pair
+    query = model.query.filter(model.identity_id == identity_id)
+    before = get_int_arg('before')
+    if before is not None:
+        query = query.filter(model.id < before)
+
+    limit = get_limit()
+    pairs = query.order_by(model.id.desc()).limit(limit).all()
+
+    return jsonify(items=[serialize_pair_summary(pair) for pair in pairs],
+                   next=pairs[-1].id if len(pairs) == limit else None)
+
+
+@blueprint.route('/pairs/<int:pair_id>')
+def get_pair(pair_id):
+    # pairs are immutable, so pair ID is a strong validator
+    etag = str(pair_id)
+    response = not_modified(etag)
+    if response and db.session.query(Pair.id).filter(Pair.id == pair_id).count():
+        return response
+
+    pair = Pair.query.get(pair_id)
+    if pair is None:
+        abort(404, 'Pair not found')
+
+    Identity.prefetch_pairs([pair.identity])
+    return with_etag(jsonify(serialize_pair(pair, pair.identity.get_cert_chain()[1:])), etag)
+
+
+@blueprint.route('/pairs/<int:pair_id>/revert', methods=['POST'])
+def revert_pair(pair_id):
+    old_pair = Pair.query.get(pair_id)
+    if old_pair is None:
+        abort(404, 'Pair not found')
+
+    identity = old_pair.identity
+    identity.pair = models.Pair(old_pair.cert, old_pair.key)
+    return issuance_response(identity, identity.pair)
+
+
+@blueprint.route('/pairs/<int:pair_id>/revoke', methods=['POST'])
+def revoke_pair(pair_id):
+    pair = Pair.query.get(pair_id)
+    if pair is None:
+        abort(404, 'Pair not found')
+
+    reason = (request.get_json(silent=True) or {}).get('reason', 'unspecified')
+    if reason not in x509.REVOCATION_REASONS:
+        abort(400, 'Unknown revocation reason')
+
+    pair.revoke(reason)
+    db.session.commit()
+    return jsonify(serialize_pair_summary(pair))
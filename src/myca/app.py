@@ -4,7 +4,7 @@ from flask import Flask
 from flask_migrate import Migrate
 from werkzeug.contrib.fixers import ProxyFix
 
-from myca import config, models
+from myca import config, models, api, crl, ocsp, metrics, k8s
 from myca.admin import admin
 
 
@@ -13,6 +13,14 @@ app = Flask(__name__, template_folder='admin/templates')
 app.secret_key = config.secret_key
 app.config['SQLALCHEMY_DATABASE_URI'] = config.database_uri
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+if not config.database_uri.startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': config.database_pool_size,
+        'max_overflow': config.database_max_overflow,
+        'pool_timeout': config.database_pool_timeout,
+        'pool_recycle': config.database_pool_recycle,
+        'pool_pre_ping': config.database_pool_pre_ping,
+    }
 
 if config.reverse_proxy_count:
     app.wsgi_app = ProxyFix(app.wsgi_app, num_proxies=config.reverse_proxy_count)
@@ -22,4 +30,9 @@ models.db.init_app(app)
 
 migrate = Migrate(app, models.db, directory=os.path.join(config.app_root, 'myca', 'migrations'))
 
+metrics.init_app(app)
+k8s.init_app(app)
 admin.init_app(app)
+app.register_blueprint(api.blueprint, url_prefix='/api')
+app.register_blueprint(crl.blueprint, url_prefix='/crl')
+app.register_blueprint(ocsp.blueprint, url_prefix='/ocsp')
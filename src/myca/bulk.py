@@ -0,0 +1,144 @@
+import os
+import time
+import logging
+import datetime
+import collections
+import concurrent.futures
+
+from myca import config, x509, models, issuance, worker
+
+log = logging.getLogger(__name__)
+
+
+class Report:
+    def __init__(self, total=0):
+        self.total = total
+        self.reissued = 0
+        self.queued = 0
+        self.failed = []
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def processed(self):
+        return self.reissued + self.queued + len(self.failed)
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def fail(self, identity, error):
+        log.warning('Failed to reissue %s: %s', identity, error)
+        self.failed.append({
+            'id': identity.id,
+            'name': identity.name,
+            'error': str(error) or error.__class__.__name__,
+        })
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'reissued': self.reissued,
+            'queued': self.queued,
+            'failed': self.failed,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+    def __str__(self):
+        return '{} of {} processed: {} reissued, {} queued, {} failed in {:.1f}s'.format(
+            self.processed, self.total, self.reissued, self.queued, len(self.failed), self.elapsed)
+
+
+def select(issuer_id=None, include_issuer=True, expiring_within=None):
+    if issuer_id is not None:
+        query = models.Identity.query_subtree(issuer_id, include_issuer=include_issuer)
+    else:
+        query = models.Identity.query
+
+    query = query.join(models.Pair, models.Identity.current_pair_id == models.Pair.id)
+    if expiring_within is not None:
+        query = query.filter(models.Pair.not_after <= datetime.datetime.utcnow() + expiring_within)
+
+    return query.order_by(models.Identity.id).all()
+
+
+def get_depth(identity):
+    depth = 0
+    while identity.issuer:
+        identity = identity.issuer
+        depth += 1
+    return depth
+
+
+def get_levels(identities):
+    # issuers go first, so their children are signed with the new issuer pair
+    levels = collections.defaultdict(list)
+    for identity in identities:
+        levels[get_depth(identity)].append(identity)
+    return [levels[depth] for depth in sorted(levels)]
+
+
+def enqueue(identities, report=None):
+    report = report or Report(len(identities))
+    models.Identity.prefetch_pairs(identities)
+    models.Identity.prefetch_jobs(identities)
+
+    for level in get_levels(identities):
+        for identity in level:
+            if identity.job and identity.job.is_active:
+                report.fail(identity, 'reissue is already queued')
+                continue
+            issuance.enqueue(identity, models.Job.KIND_REISSUE)
+            report.queued += 1
+    models.db.session.commit()
+
+    report.finished_at = time.monotonic()
+    return report
+
+
+def reissue(identities, concurrency=None, batch_size=None, progress=None):
+    session = models.db.session
+    batch_size = batch_size or config.bulk_batch_size
+    report = Report(len(identities))
+
+    models.Identity.prefetch_pairs(identities)
+
+    if config.async_issuance:
+        return enqueue(identities, report)
+
+    concurrency = concurrency or os.cpu_count()
+    with concurrent.futures.ProcessPoolExecutor(concurrency) as executor:
+        for level in get_levels(identities):
+            tasks = []
+            for identity in level:
+                try:
+                    info = x509.load_certificate_info(identity.pair.as_tuple, reissue=True)
+                    issuer_pair = identity.issuer.pair if identity.issuer else None
+                except Exception as e:
+                    report.fail(identity, e)
+                    continue
+                tasks.append((identity, info,
+                              issuer_pair.id if issuer_pair else None,
+                              issuer_pair.as_tuple if issuer_pair else None))
+
+            pending = 0
+            for identity, result in worker.iter_results(worker.submit_batches(executor, tasks, concurrency)):
+                if isinstance(result, Exception):
+                    report.fail(identity, result)
+                else:
+                    identity.pair = models.Pair(*result)
+                    report.reissued += 1
+                    pending += 1
+
+                if pending >= batch_size:
+                    session.commit()
+                    pending = 0
+                    if progress:
+                        progress(report)
+
+            session.commit()
+            if progress:
+                progress(report)
+
+    report.finished_at = time.monotonic()
+    return report
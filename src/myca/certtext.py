@@ -0,0 +1,200 @@
+from cryptography import x509
+from cryptography.x509.oid import NameOID, ExtensionOID, ExtendedKeyUsageOID, SignatureAlgorithmOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
+
+OID_NAMES = {
+    SignatureAlgorithmOID.RSA_WITH_MD5: 'md5WithRSAEncryption',
+    SignatureAlgorithmOID.RSA_WITH_SHA1: 'sha1WithRSAEncryption',
+    SignatureAlgorithmOID.RSA_WITH_SHA224: 'sha224WithRSAEncryption',
+    SignatureAlgorithmOID.RSA_WITH_SHA256: 'sha256WithRSAEncryption',
+    SignatureAlgorithmOID.RSA_WITH_SHA384: 'sha384WithRSAEncryption',
+    SignatureAlgorithmOID.RSA_WITH_SHA512: 'sha512WithRSAEncryption',
+    SignatureAlgorithmOID.RSASSA_PSS: 'rsassaPss',
+    SignatureAlgorithmOID.ECDSA_WITH_SHA1: 'ecdsa-with-SHA1',
+    SignatureAlgorithmOID.ECDSA_WITH_SHA224: 'ecdsa-with-SHA224',
+    SignatureAlgorithmOID.ECDSA_WITH_SHA256: 'ecdsa-with-SHA256',
+    SignatureAlgorithmOID.ECDSA_WITH_SHA384: 'ecdsa-with-SHA384',
+    SignatureAlgorithmOID.ECDSA_WITH_SHA512: 'ecdsa-with-SHA512',
+    SignatureAlgorithmOID.DSA_WITH_SHA1: 'dsaWithSHA1',
+    SignatureAlgorithmOID.DSA_WITH_SHA224: 'dsa_with_SHA224',
+    SignatureAlgorithmOID.DSA_WITH_SHA256: 'dsa_with_SHA256',
+    SignatureAlgorithmOID.ED25519: 'ED25519',
+}
+
+NAME_LABELS = {
+    NameOID.COUNTRY_NAME: 'C',
+    NameOID.STATE_OR_PROVINCE_NAME: 'ST',
+    NameOID.LOCALITY_NAME: 'L',
+    NameOID.ORGANIZATION_NAME: 'O',
+    NameOID.ORGANIZATIONAL_UNIT_NAME: 'OU',
+    NameOID.COMMON_NAME: 'CN',
+    NameOID.SERIAL_NUMBER: 'serialNumber',
+    NameOID.DN_QUALIFIER: 'dnQualifier',
+    NameOID.EMAIL_ADDRESS: 'emailAddress',
+}
+
+EXTENSION_LABELS = {
+    ExtensionOID.SUBJECT_KEY_IDENTIFIER: 'X509v3 Subject Key Identifier',
+    ExtensionOID.AUTHORITY_KEY_IDENTIFIER: 'X509v3 Authority Key Identifier',
+    ExtensionOID.KEY_USAGE: 'X509v3 Key Usage',
+    ExtensionOID.EXTENDED_KEY_USAGE: 'X509v3 Extended Key Usage',
+    ExtensionOID.SUBJECT_ALTERNATIVE_NAME: 'X509v3 Subject Alternative Name',
+    ExtensionOID.BASIC_CONSTRAINTS: 'X509v3 Basic Constraints',
+}
+
+EXTENDED_KEY_USAGE_LABELS = {
+    ExtendedKeyUsageOID.SERVER_AUTH: 'TLS Web Server Authentication',
+    ExtendedKeyUsageOID.CLIENT_AUTH: 'TLS Web Client Authentication',
+    ExtendedKeyUsageOID.CODE_SIGNING: 'Code Signing',
+    ExtendedKeyUsageOID.EMAIL_PROTECTION: 'E-mail Protection',
+    ExtendedKeyUsageOID.TIME_STAMPING: 'Time Stamping',
+    ExtendedKeyUsageOID.OCSP_SIGNING: 'OCSP Signing',
+}
+
+KEY_USAGE_LABELS = [
+    ('digital_signature', 'Digital Signature'),
+    ('content_commitment', 'Non Repudiation'),
+    ('key_encipherment', 'Key Encipherment'),
+    ('data_encipherment', 'Data Encipherment'),
+    ('key_agreement', 'Key Agreement'),
+    ('key_cert_sign', 'Certificate Sign'),
+    ('crl_sign', 'CRL Sign'),
+]
+
+
+def render(cert):
+    lines = [
+        'Certificate:',
+        '    Data:',
+        '        Version: {} (0x{:x})'.format(cert.version.value + 1, cert.version.value),
+        '        Serial Number:',
+        '            ' + format_hex(int_to_bytes(cert.serial_number)),
+        '        Signature Algorithm: ' + format_oid(cert.signature_algorithm_oid),
+        '        Issuer: ' + format_name(cert.issuer),
+        '        Validity',
+        '            Not Before: ' + format_time(cert.not_valid_before),
+        '            Not After : ' + format_time(cert.not_valid_after),
+        '        Subject: ' + format_name(cert.subject),
+        '        Subject Public Key Info:',
+    ]
+    lines += ['            ' + line for line in render_public_key(cert.public_key())]
+
+    if cert.extensions:
+        lines.append('        X509v3 extensions:')
+        for extension in cert.extensions:
+            label = EXTENSION_LABELS.get(extension.oid, format_oid(extension.oid))
+            lines.append('            {}:{}'.format(label, ' critical' if extension.critical else ''))
+            lines += ['                ' + line for line in render_extension(extension.value)]
+
+    lines += [
+        '    Signature Algorithm: ' + format_oid(cert.signature_algorithm_oid),
+        '    Fingerprints:',
+        '        SHA-256: ' + format_hex(cert.fingerprint(hashes.SHA256())),
+        '        SHA-1: ' + format_hex(cert.fingerprint(hashes.SHA1())),
+    ]
+    return '\n'.join(lines) + '\n' + cert.public_bytes(serialization.Encoding.PEM).decode('ascii')
+
+
+def render_public_key(public_key):
+    if isinstance(public_key, rsa.RSAPublicKey):
+        numbers = public_key.public_numbers()
+        lines = [
+            'Public Key Algorithm: rsaEncryption',
+            '    Public-Key: ({} bit)'.format(public_key.key_size),
+            '    Modulus:',
+        ]
+        lines += ['        ' + line for line in wrap_hex(int_to_bytes(numbers.n, leading_zero=True))]
+        lines.append('    Exponent: {0} (0x{0:x})'.format(numbers.e))
+        return lines
+
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        return [
+            'Public Key Algorithm: id-ecPublicKey',
+            '    Public-Key: ({} bit)'.format(public_key.curve.key_size),
+            '    ASN1 OID: ' + public_key.curve.name,
+        ]
+
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        raw = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        return ['Public Key Algorithm: ED25519', '    ED25519 Public-Key:'] + ['        ' + line for line in wrap_hex(raw)]
+
+    return ['Public Key Algorithm: ' + public_key.__class__.__name__.lstrip('_')]
+
+
+def render_extension(value):
+    if isinstance(value, x509.SubjectKeyIdentifier):
+        return [format_hex(value.digest)]
+
+    if isinstance(value, x509.AuthorityKeyIdentifier):
+        lines = []
+        if value.key_identifier:
+            lines.append('keyid:' + format_hex(value.key_identifier))
+        for name in value.authority_cert_issuer or []:
+            lines.append(format_general_name(name))
+        if value.authority_cert_serial_number is not None:
+            lines.append('serial:' + format_hex(int_to_bytes(value.authority_cert_serial_number)))
+        return lines
+
+    if isinstance(value, x509.KeyUsage):
+        usages = [label for attr, label in KEY_USAGE_LABELS if getattr(value, attr)]
+        if value.key_agreement:
+            if value.encipher_only:
+                usages.append('Encipher Only')
+            if value.decipher_only:
+                usages.append('Decipher Only')
+        return [', '.join(usages)]
+
+    if isinstance(value, x509.ExtendedKeyUsage):
+        return [', '.join(EXTENDED_KEY_USAGE_LABELS.get(oid, format_oid(oid)) for oid in value)]
+
+    if isinstance(value, x509.SubjectAlternativeName):
+        return [', '.join(format_general_name(name) for name in value)]
+
+    if isinstance(value, x509.BasicConstraints):
+        text = 'CA:TRUE' if value.ca else 'CA:FALSE'
+        if value.path_length is not None:
+            text += ', pathlen:{}'.format(value.path_length)
+        return [text]
+
+    return [repr(value)]
+
+
+def format_general_name(name):
+    if isinstance(name, x509.DNSName):
+        return 'DNS:' + name.value
+    if isinstance(name, x509.IPAddress):
+        return 'IP Address:' + str(name.value)
+    if isinstance(name, x509.RFC822Name):
+        return 'email:' + name.value
+    if isinstance(name, x509.UniformResourceIdentifier):
+        return 'URI:' + name.value
+    if isinstance(name, x509.DirectoryName):
+        return 'DirName:' + format_name(name.value)
+    return str(name.value)
+
+
+def format_name(name):
+    return ', '.join('{} = {}'.format(NAME_LABELS.get(attr.oid, format_oid(attr.oid)), attr.value) for attr in name)
+
+
+def format_oid(oid):
+    return OID_NAMES.get(oid, oid.dotted_string)
+
+
+def format_time(value):
+    return '{:%b} {:2d} {:%H:%M:%S %Y} GMT'.format(value, value.day, value)
+
+
+def format_hex(data):
+    return ':'.join('{:02x}'.format(b) for b in data)
+
+
+def wrap_hex(data, width=15):
+    return [format_hex(data[i:i + width]) + (':' if i + width < len(data) else '')
+            for i in range(0, len(data), width)]
+
+
+def int_to_bytes(value, leading_zero=False):
+    length = max(1, (value.bit_length() + 7) // 8 + (1 if leading_zero and value.bit_length() % 8 == 0 else 0))
+    return value.to_bytes(length, 'big')
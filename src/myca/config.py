@@ -4,5 +4,62 @@ app_root = os.path.dirname(os.path.dirname(__file__))
 
 secret_key = os.environ.get('SECRET_KEY', '-')
 database_uri = os.environ.get('DATABASE_URI', 'postgres://postgres@postgres/postgres')
+database_replica_uri = os.environ.get('DATABASE_REPLICA_URI')
+database_replica_lag = float(os.environ.get('DATABASE_REPLICA_LAG', 10))
+database_pool_size = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+database_max_overflow = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+database_pool_timeout = float(os.environ.get('DATABASE_POOL_TIMEOUT', 30))
+database_pool_recycle = int(os.environ.get('DATABASE_POOL_RECYCLE', -1))
+database_pool_pre_ping = bool(int(os.environ.get('DATABASE_POOL_PRE_PING', 1)))
+database_statement_timeout = float(os.environ.get('DATABASE_STATEMENT_TIMEOUT', 0))
 reverse_proxy_count = int(os.environ.get('REVERSE_PROXY_COUNT', 0))
 plugins_dir = os.environ.get('PLUGINS_DIR')
+x509_cache_size = int(os.environ.get('X509_CACHE_SIZE', 4096))
+key_pool_size = int(os.environ.get('KEY_POOL_SIZE', 4))
+key_pool_workers = int(os.environ.get('KEY_POOL_WORKERS', 1))
+async_issuance = bool(int(os.environ.get('ASYNC_ISSUANCE', 0)))
+worker_concurrency = int(os.environ.get('WORKER_CONCURRENCY', 0)) or None
+worker_poll_interval = float(os.environ.get('WORKER_POLL_INTERVAL', 1))
+worker_job_timeout = int(os.environ.get('WORKER_JOB_TIMEOUT', 600))
+bulk_batch_size = int(os.environ.get('BULK_BATCH_SIZE', 100))
+cert_text_openssl = bool(int(os.environ.get('CERT_TEXT_OPENSSL', 0)))
+export_batch_size = int(os.environ.get('EXPORT_BATCH_SIZE', 500))
+crl_lifetime = int(os.environ.get('CRL_LIFETIME', 24 * 3600))
+crl_delta_lifetime = int(os.environ.get('CRL_DELTA_LIFETIME', 3600))
+crl_cache_size = int(os.environ.get('CRL_CACHE_SIZE', 256))
+ocsp_validity = int(os.environ.get('OCSP_VALIDITY', 24 * 3600))
+ocsp_refresh_margin = int(os.environ.get('OCSP_REFRESH_MARGIN', 6 * 3600))
+ocsp_refresh_interval = int(os.environ.get('OCSP_REFRESH_INTERVAL', 60))
+ocsp_cache_size = int(os.environ.get('OCSP_CACHE_SIZE', 10000))
+signer_cache_size = int(os.environ.get('SIGNER_CACHE_SIZE', 256))
+verify_batch_size = int(os.environ.get('VERIFY_BATCH_SIZE', 1000))
+metrics_enabled = bool(int(os.environ.get('METRICS_ENABLED', 0)))
+metrics_dir = os.environ.get('METRICS_DIR')
+metrics_flush_interval = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+slow_request_threshold = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 0))
+pair_retention_count = int(os.environ.get('PAIR_RETENTION_COUNT', 0))
+pair_retention_days = int(os.environ.get('PAIR_RETENTION_DAYS', 0))
+archive_batch_size = int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000))
+renew_fraction = float(os.environ.get('RENEW_FRACTION', 2 / 3))
+renew_jitter = float(os.environ.get('RENEW_JITTER', 0.1))
+renew_rate = int(os.environ.get('RENEW_RATE', 60))
+renew_poll_interval = float(os.environ.get('RENEW_POLL_INTERVAL', 60))
+k8s_api_url = os.environ.get('K8S_API_URL') or ('https://{}:{}'.format(os.environ['KUBERNETES_SERVICE_HOST'],
+                                                                     os.environ.get('KUBERNETES_SERVICE_PORT', 443))
+                                                if 'KUBERNETES_SERVICE_HOST' in os.environ else None)
+k8s_token_file = os.environ.get('K8S_TOKEN_FILE', '/var/run/secrets/kubernetes.io/serviceaccount/token')
+k8s_ca_file = os.environ.get('K8S_CA_FILE', '/var/run/secrets/kubernetes.io/serviceaccount/ca.crt')
+k8s_namespace = os.environ.get('K8S_NAMESPACE', 'default')
+k8s_timeout = float(os.environ.get('K8S_TIMEOUT', 10))
+k8s_sync_on_commit = bool(int(os.environ.get('K8S_SYNC_ON_COMMIT', 0)))
+k8s_sync_batch_size = int(os.environ.get('K8S_SYNC_BATCH_SIZE', 50))
+k8s_sync_interval = float(os.environ.get('K8S_SYNC_INTERVAL', 30))
+k8s_sync_max_backoff = float(os.environ.get('K8S_SYNC_MAX_BACKOFF', 300))
+serve_bind = os.environ.get('SERVE_BIND', '0.0.0.0:5000')
+serve_workers = int(os.environ.get('SERVE_WORKERS', 0)) or None
+serve_threads = int(os.environ.get('SERVE_THREADS', 4))
+serve_timeout = int(os.environ.get('SERVE_TIMEOUT', 120))
+serve_graceful_timeout = int(os.environ.get('SERVE_GRACEFUL_TIMEOUT', 30))
+serve_max_requests = int(os.environ.get('SERVE_MAX_REQUESTS', 1000))
+serve_max_requests_jitter = int(os.environ.get('SERVE_MAX_REQUESTS_JITTER', 100))
+warm_key_types = [t for t in os.environ.get('WARM_KEY_TYPES', 'rsa-2048').split(',') if t]
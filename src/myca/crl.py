@@ -0,0 +1,118 @@
+import datetime
+
+from flask import Blueprint, Response, abort, request
+from sqlalchemy import func
+
+from myca import config, x509, models
+from myca.cache import LRUCache
+
+blueprint = Blueprint('crl', __name__)
+
+db = models.db
+Identity = models.Identity
+Pair = models.Pair
+
+cache = LRUCache(config.crl_cache_size)
+
+
+class SignedCrl:
+    def __init__(self, data, number, this_update, next_update, revision, delta_base=None):
+        self.data = data
+        self.number = number
+        self.this_update = this_update
+        self.next_update = next_update
+        self.revision = revision
+        self.delta_base = delta_base
+
+    def is_fresh(self, revision, delta_base, now):
+        return self.revision == revision and self.delta_base == delta_base and now < self.next_update
+
+
+def get_revision(ca):
+    # a revocation changes max(revoked_at) among the issuer's pairs only, CRLs of other issuers stay cached
+    return db.session.query(func.max(Pair.revoked_at)) \
+        .join(Identity, Pair.identity_id == Identity.id) \
+        .filter(Identity.issuer_id == ca.id) \
+        .scalar()
+
+
+def to_number(value):
+    return int((value - datetime.datetime(1970, 1, 1)).total_seconds() * 1000)
+
+
+def get_delta_base_time(now):
+    # deterministic in all processes: any complete CRL still within its lifetime is newer than this point
+    period = datetime.timedelta(seconds=config.crl_lifetime)
+    epoch = datetime.datetime(1970, 1, 1)
+    return epoch + (now - epoch) // period * period - period
+
+
+def query_revoked(ca, now, since=None):
+    query = db.session.query(Pair.serial, Pair.revoked_at, Pair.revocation_reason) \
+        .join(Identity, Pair.identity_id == Identity.id) \
+        .filter(Identity.issuer_id == ca.id,
+                Pair.revoked_at.isnot(None),
+                Pair.not_after > now)
+    if since is not None:
+        query = query.filter(Pair.revoked_at >= since)
+    return query.order_by(Pair.id)
+
+
+def get_crl(ca, delta=False):
+    ca_pair = ca.pair
+    if ca_pair is None:
+        return None
+
+    now = datetime.datetime.utcnow()
+    revision = get_revision(ca)
+    delta_base_time = get_delta_base_time(now) if delta else None
+    delta_base = to_number(delta_base_time) if delta else None
+
+    key = ca_pair.id, delta
+    crl = cache.get(key)
+    if crl is not None and crl.is_fresh(revision, delta_base, now):
+        return crl
+
+    lifetime = config.crl_delta_lifetime if delta else config.crl_lifetime
+    next_update = now + datetime.timedelta(seconds=lifetime)
+    number = to_number(now)
+
+    revoked = query_revoked(ca, now, since=delta_base_time)
+    data = x509.build_crl(ca_pair.as_tuple, revoked, number, now, next_update, delta_base=delta_base)
+
+    crl = SignedCrl(data, number, now, next_update, revision, delta_base)
+    cache.set(key, crl)
+    return crl
+
+
+def crl_response(identity_id, delta):
+    ca = Identity.query.get(identity_id)
+    if ca is None:
+        abort(404)
+
+    crl = get_crl(ca, delta=delta)
+    if crl is None:
+        abort(404)
+
+    if request.args.get('format') == 'pem':
+        data = x509.crl_to_pem(crl.data)
+        mimetype = 'application/x-pem-file'
+    else:
+        data = crl.data
+        mimetype = 'application/pkix-crl'
+
+    response = Response(data, mimetype=mimetype)
+    response.set_etag(str(crl.number))
+    response.last_modified = crl.this_update
+    response.expires = crl.next_update
+    return response.make_conditional(request)
+
+
+@blueprint.route('/<int:identity_id>.crl')
+def full_crl_view(identity_id):
+    return crl_response(identity_id, delta=False)
+
+
+@blueprint.route('/<int:identity_id>-delta.crl')
+def delta_crl_view(identity_id):
+    return crl_response(identity_id, delta=True)
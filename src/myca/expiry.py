@@ -0,0 +1,61 @@
+import datetime
+
+from myca import models
+
+db = models.db
+Identity = models.Identity
+Pair = models.Pair
+
+
+def query_expiring_ids(till):
+    expiring = db.session.query(Identity.id) \
+        .join(Pair, Identity.current_pair_id == Pair.id) \
+        .filter(Pair.not_after <= till) \
+        .cte(recursive=True)
+    # certificates issued by an expiring CA become invalid together with it
+    expiring = expiring.union(db.session.query(Identity.id).join(expiring, Identity.issuer_id == expiring.c.id))
+    return db.session.query(expiring.c.id)
+
+
+def find_expiring(within, now=None):
+    now = now or datetime.datetime.utcnow()
+    till = now + within
+
+    rows = db.session.query(Identity.id, Identity.name, Identity.issuer_id, Pair.serial, Pair.not_after, Pair.is_ca) \
+        .join(Pair, Identity.current_pair_id == Pair.id) \
+        .filter(Identity.id.in_(query_expiring_ids(till))) \
+        .all()
+    by_id = {row.id: row for row in rows}
+
+    result = []
+    for row in rows:
+        expires_at = row.not_after
+        cause = None
+
+        issuer = by_id.get(row.issuer_id)
+        while issuer:
+            if issuer.not_after < expires_at:
+                expires_at = issuer.not_after
+                cause = issuer
+            issuer = by_id.get(issuer.issuer_id)
+
+        if cause is None:
+            status = 'expired' if row.not_after <= now else 'expiring'
+        else:
+            status = 'issuer_expired' if expires_at <= now else 'issuer_expiring'
+
+        result.append({
+            'id': row.id,
+            'name': row.name,
+            'issuer_id': row.issuer_id,
+            'serial': row.serial,
+            'is_ca': bool(row.is_ca),
+            'not_after': row.not_after,
+            'expires_at': expires_at,
+            'status': status,
+            'cause_id': cause.id if cause else None,
+            'cause_name': cause.name if cause else None,
+        })
+
+    result.sort(key=lambda item: (item['expires_at'], item['id']))
+    return result
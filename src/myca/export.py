@@ -0,0 +1,177 @@
+import io
+import re
+import time
+import base64
+import tarfile
+import zipfile
+import collections
+
+from sqlalchemy.orm import aliased
+
+from myca import config, x509, models
+
+db = models.db
+Identity = models.Identity
+Pair = models.Pair
+Blob = models.Blob
+
+FORMATS = {
+    'tar': ('application/x-tar', 'tar'),
+    'tgz': ('application/gzip', 'tar.gz'),
+    'zip': ('application/zip', 'zip'),
+    'k8s': ('application/yaml', 'yaml'),
+}
+
+
+class StreamBuffer:
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def load_issuer_chains():
+    issuers = db.session.query(Identity.issuer_id).filter(Identity.issuer_id.isnot(None)).distinct()
+    rows = db.session.query(Identity.id, Identity.issuer_id, Blob.data.label('cert')) \
+        .join(Pair, Identity.current_pair_id == Pair.id) \
+        .join(Blob, Pair.cert_digest == Blob.digest) \
+        .filter(Identity.id.in_(issuers)) \
+        .all()
+    by_id = {row.id: row for row in rows}
+
+    def get_chain(identity_id):
+        chain = []
+        row = by_id.get(identity_id)
+        while row:
+            chain.append(x509.cert_to_pem(row.cert))
+            row = by_id.get(row.issuer_id)
+        return chain
+
+    return {identity_id: get_chain(identity_id) for identity_id in by_id}
+
+
+def iter_items(issuer_id=None, batch_size=None):
+    chains = load_issuer_chains()
+
+    cert_blob = aliased(Blob)
+    key_blob = aliased(Blob)
+    query = db.session.query(Identity.id, Identity.name, Identity.issuer_id,
+                             cert_blob.data.label('cert'), key_blob.data.label('key')) \
+        .join(Pair, Identity.current_pair_id == Pair.id) \
+        .join(cert_blob, Pair.cert_digest == cert_blob.digest) \
+        .join(key_blob, Pair.key_digest == key_blob.digest)
+    if issuer_id is not None:
+        query = query.filter(Identity.id.in_(Identity.query_subtree(issuer_id).with_entities(Identity.id)))
+
+    for row in query.order_by(Identity.id).yield_per(batch_size or config.export_batch_size):
+        yield {
+            'id': row.id,
+            'name': row.name,
+            'cert': x509.cert_to_pem(row.cert),
+            'key': x509.key_to_pem(row.key),
+            'chain': b''.join(chains.get(row.issuer_id, [])),
+        }
+
+
+def get_file_name(item):
+    return '{}-{}'.format(item['id'], re.sub(r'[^\w.-]+', '_', item['name']))
+
+
+def get_secret_name(item):
+    # a DNS-1123 label, the id keeps names which differ only in case or punctuation apart
+    suffix = '-{}'.format(item['id'])
+    name = re.sub(r'[^a-z0-9]+', '-', item['name'].lower()).strip('-')[:63 - len(suffix)].rstrip('-')
+    return (name or 'identity') + suffix
+
+
+def get_secret_data(item):
+    data = collections.OrderedDict([
+        ('tls.crt', base64.b64encode(item['cert']).decode('ascii')),
+        ('tls.key', base64.b64encode(item['key']).decode('ascii')),
+    ])
+    if item['chain']:
+        data['ca.crt'] = base64.b64encode(item['chain']).decode('ascii')
+    return data
+
+
+def get_files(item):
+    files = [('cert.pem', item['cert']), ('key.pem', item['key'])]
+    if item['chain']:
+        files.append(('chain.pem', item['chain']))
+    return files
+
+
+def stream_tar(items, compress=False):
+    buf = StreamBuffer()
+    with tarfile.open(fileobj=buf, mode='w|gz' if compress else 'w|') as tar:
+        for item in items:
+            directory = get_file_name(item)
+            for name, data in get_files(item):
+                info = tarfile.TarInfo('{}/{}'.format(directory, name))
+                info.size = len(data)
+                info.mtime = time.time()
+                info.mode = 0o600 if name == 'key.pem' else 0o644
+                tar.addfile(info, io.BytesIO(data))
+            yield buf.drain()
+    yield buf.drain()
+
+
+def stream_zip(items):
+    buf = StreamBuffer()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for item in items:
+            directory = get_file_name(item)
+            for name, data in get_files(item):
+                archive.writestr('{}/{}'.format(directory, name), data)
+            yield buf.drain()
+    yield buf.drain()
+
+
+def stream_k8s(items, namespace=None):
+    for item in items:
+        lines = [
+            '---',
+            'apiVersion: v1',
+            'kind: Secret',
+            'type: kubernetes.io/tls',
+            'metadata:',
+            '  name: {}'.format(get_secret_name(item)),
+        ]
+        if namespace:
+            lines.append('  namespace: {}'.format(namespace))
+        lines += [
+            '  labels:',
+            '    myca/identity-id: "{}"'.format(item['id']),
+            'data:',
+        ]
+        lines += ['  {}: {}'.format(name, value) for name, value in get_secret_data(item).items()]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def stream(export_format, issuer_id=None, namespace=None):
+    items = iter_items(issuer_id)
+
+    if export_format == 'tar':
+        return stream_tar(items)
+    if export_format == 'tgz':
+        return stream_tar(items, compress=True)
+    if export_format == 'zip':
+        return stream_zip(items)
+    if export_format == 'k8s':
+        return stream_k8s(items, namespace)
+    raise ValueError('Unknown export format: {}'.format(export_format))
@@ -0,0 +1,274 @@
+import io
+import re
+import time
+import logging
+import pathlib
+import zlib
+import tarfile
+import collections
+
+from sqlalchemy.exc import IntegrityError
+
+from myca import config, x509, models
+
+log = logging.getLogger(__name__)
+
+
+class ImportFailed(Exception):
+    pass
+
+
+class IssuerNotFound(ImportFailed):
+    pass
+
+
+class UnreadableFile(ImportFailed):
+    def __init__(self, source, error):
+        super().__init__('neither PEM nor a readable tar archive ({}).'.format(error or error.__class__.__name__))
+        self.source = source
+
+
+def find_issuer(cert_data, issuer_cn=None):
+    authority_key_id = x509.get_certificate_metadata(cert_data)['authority_key_id']
+
+    candidates = []
+    if authority_key_id:
+        candidates = models.Identity.query \
+            .join(models.Pair, models.Identity.current_pair_id == models.Pair.id) \
+            .filter(models.Pair.subject_key_id == authority_key_id) \
+            .all()
+    if not candidates and issuer_cn:
+        # certificates without AKI, or issued by a CA certificate without SKI
+        candidates = models.Identity.query.filter_by(name=issuer_cn).all()
+
+    models.Identity.prefetch_pairs(candidates)
+    for issuer in candidates:
+        try:
+            x509.verify_certificate_chain(cert_data, issuer.get_cert_chain())
+        except x509.InvalidCertificate:
+            pass
+        else:
+            return issuer
+
+
+def import_pair(pair_tuple, issuer=None):
+    try:
+        info = x509.load_certificate_info(pair_tuple)
+    except ValueError as e:
+        raise ImportFailed('broken certificate or key.') from e
+
+    if not x509.does_keys_match(pair_tuple):
+        raise ImportFailed('keys does not match.')
+
+    identity = models.Identity()
+    identity.name = info.subj_cn
+
+    if not info.self_signed:
+        identity.issuer = issuer or find_issuer(pair_tuple[0], info.issuer_cn)
+        if not identity.issuer:
+            raise IssuerNotFound('issuer identity not found.')
+
+    models.db.session.add(identity)
+    identity.pair = models.Pair(*pair_tuple)
+    return identity
+
+
+PEM_BLOCK_RE = re.compile(rb'-----BEGIN ([A-Z0-9 ]+)-----\r?\n.*?-----END \1-----\r?\n?', re.S)
+CERTIFICATE_BLOCK_TYPES = {b'CERTIFICATE', b'X509 CERTIFICATE', b'TRUSTED CERTIFICATE'}
+KEY_BLOCK_TYPES = {b'PRIVATE KEY', b'RSA PRIVATE KEY', b'EC PRIVATE KEY'}
+
+
+class Report:
+    def __init__(self):
+        self.total = 0
+        self.imported = 0
+        self.skipped = 0
+        self.failed = []
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def fail(self, source, name, error):
+        log.warning('Failed to import %s (%s): %s', source, name, error)
+        self.failed.append({
+            'source': source,
+            'name': name,
+            'error': str(error) or error.__class__.__name__,
+        })
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+    def __str__(self):
+        return '{} of {} processed: {} imported, {} skipped, {} failed in {:.1f}s'.format(
+            self.imported + self.skipped + len(self.failed), self.total,
+            self.imported, self.skipped, len(self.failed), self.elapsed)
+
+
+def iter_path(path):
+    path = pathlib.Path(path)
+
+    if path.is_dir():
+        for file_path in sorted(path.rglob('*')):
+            if file_path.is_file():
+                yield from iter_path(file_path)
+    elif tarfile.is_tarfile(str(path)):
+        with path.open('rb') as f:
+            yield from iter_tar(f, str(path))
+    else:
+        yield str(path), path.read_bytes()
+
+
+def iter_fileobj(fileobj, name):
+    head = fileobj.read(512)
+    fileobj.seek(0)
+
+    if b'-----BEGIN ' in head:
+        yield name, fileobj.read()
+    else:
+        yield from iter_tar(fileobj, name)
+
+
+def iter_tar(fileobj, name):
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+            for member in tar:
+                if member.isfile():
+                    yield '{}:{}'.format(name, member.name), tar.extractfile(member).read()
+    except (tarfile.TarError, EOFError, zlib.error, OSError) as e:
+        raise UnreadableFile(name, e) from e
+
+
+def sort_issuers_first(certs):
+    metadata = [x509.get_certificate_metadata(cert) for source, cert, key_id in certs]
+    by_subject_key_id = {m['subject_key_id']: i for i, m in enumerate(metadata) if m['subject_key_id']}
+
+    depths = {}
+
+    def get_depth(i, seen=()):
+        if i not in depths:
+            issuer = by_subject_key_id.get(metadata[i]['authority_key_id'])
+            if issuer is None or issuer == i or issuer in seen:
+                depths[i] = 0
+            else:
+                depths[i] = get_depth(issuer, seen + (i,)) + 1
+        return depths[i]
+
+    order = sorted(range(len(certs)), key=lambda i: (get_depth(i), i))
+    return [certs[i] for i in order]
+
+
+def get_issuer_ref(cert_data, metadata):
+    if metadata['authority_key_id']:
+        return metadata['authority_key_id']
+    v = x509.load_certificate(cert_data).issuer.get_attributes_for_oid(x509.NameOID.COMMON_NAME)
+    return v[0].value if v else None
+
+
+class Importer:
+    def __init__(self, report, batch_size=None, progress=None):
+        self.report = report
+        self.batch_size = batch_size or config.bulk_batch_size
+        self.progress = progress
+        self.pending = 0
+        # keys stay for the whole run, a later certificate may share one, certificates are only
+        # kept while their key or issuer has not been seen yet
+        self.keys = {}
+        self.waiting_for_key = collections.defaultdict(list)
+        self.waiting_for_issuer = collections.defaultdict(list)
+
+    def add_file(self, source, data):
+        certs = []
+        for match in PEM_BLOCK_RE.finditer(data):
+            block_type, block = match.group(1), match.group(0)
+            try:
+                if block_type in CERTIFICATE_BLOCK_TYPES:
+                    certs.append((source, block, x509.get_public_key_id(cert_data=block)))
+                    self.report.total += 1
+                elif block_type in KEY_BLOCK_TYPES:
+                    key_id = x509.get_public_key_id(key_data=block)
+                    self.keys[key_id] = block
+                    certs += self.waiting_for_key.pop(key_id, [])
+            except (ValueError, TypeError) as e:
+                self.report.total += 1
+                self.report.fail(source, None, e)
+
+        for item in sort_issuers_first(certs):
+            self.add(item)
+
+    def add(self, item):
+        session = models.db.session
+        queue = collections.deque([item])
+
+        while queue:
+            item = queue.popleft()
+            source, cert, key_id = item
+            metadata = x509.get_certificate_metadata(cert)
+            if models.Pair.query.filter_by(fingerprint=metadata['fingerprint']).count():
+                self.report.skipped += 1
+                continue
+
+            key = self.keys.get(key_id)
+            if key is None:
+                self.waiting_for_key[key_id].append(item)
+                continue
+
+            try:
+                with session.begin_nested():
+                    import_pair((cert, key))
+            except IssuerNotFound:
+                self.waiting_for_issuer[get_issuer_ref(cert, metadata)].append(item)
+                continue
+            except ImportFailed as e:
+                self.report.fail(source, metadata['subject_cn'], e)
+                continue
+            except IntegrityError:
+                self.report.fail(source, metadata['subject_cn'], 'identity with same name already exists.')
+                continue
+
+            self.report.imported += 1
+            queue.extend(self.waiting_for_issuer.pop(metadata['subject_key_id'], []))
+            queue.extend(self.waiting_for_issuer.pop(metadata['subject_cn'], []))
+
+            self.pending += 1
+            if self.pending >= self.batch_size:
+                session.commit()
+                self.pending = 0
+                if self.progress:
+                    self.progress(self.report)
+
+    def finish(self):
+        for items, error in [(self.waiting_for_key, 'private key not found.'),
+                             (self.waiting_for_issuer, 'issuer identity not found.')]:
+            for item in (item for group in items.values() for item in group):
+                source, cert, key_id = item
+                self.report.fail(source, x509.get_certificate_metadata(cert)['subject_cn'], ImportFailed(error))
+        models.db.session.commit()
+
+
+def import_many(files, batch_size=None, progress=None):
+    report = Report()
+    importer = Importer(report, batch_size, progress)
+
+    # each file is imported as it is read, so only certificates still waiting for their key or issuer
+    # are held in memory
+    try:
+        for source, data in files:
+            importer.add_file(source, data)
+    except UnreadableFile as e:
+        # a stream can't be read past a broken archive, what was read so far is still imported
+        report.total += 1
+        report.fail(e.source, None, e)
+    importer.finish()
+
+    report.finished_at = time.monotonic()
+    return report
@@ -0,0 +1,31 @@
+from myca import config, x509, models, signer
+
+
+def issue(identity, info):
+    pair = models.Pair(*x509.issue_certificate(info, ca_signer=signer.get_for_issuer(identity.issuer)))
+    identity.pair = pair
+    return pair
+
+
+def reissue(identity):
+    info = x509.load_certificate_info(identity.pair.as_tuple, reissue=True)
+    return issue(identity, info)
+
+
+def enqueue(identity, kind, info=None):
+    job = models.Job(kind, info.as_json() if info is not None else None)
+    job.identity = identity
+    models.db.session.add(job)
+    return job
+
+
+def request_issue(identity, info):
+    if config.async_issuance:
+        return enqueue(identity, models.Job.KIND_ISSUE, info)
+    return issue(identity, info)
+
+
+def request_reissue(identity):
+    if config.async_issuance:
+        return enqueue(identity, models.Job.KIND_REISSUE)
+    return reissue(identity)
@@ -0,0 +1,279 @@
+import os
+import re
+import ssl
+import json
+import time
+import random
+import logging
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from sqlalchemy import event, or_
+
+from myca import config, x509, models, export
+
+log = logging.getLogger(__name__)
+
+db = models.db
+Identity = models.Identity
+
+SECRET_REF_RE = re.compile(r'^([a-z0-9]([-a-z0-9]{0,61}[a-z0-9])?/)?[a-z0-9]([-a-z0-9.]{0,251}[a-z0-9])?$')
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def retryable(self):
+        # failures of the API or our credentials as a whole, anything else is a problem with the Secret itself
+        return self.status is None or self.status in (401, 429) or self.status >= 500
+
+
+class Client:
+    def __init__(self, url, token_file=None, ca_file=None, timeout=None):
+        self.url = url.rstrip('/')
+        self.token_file = token_file
+        self.timeout = timeout or config.k8s_timeout
+        self.ssl_context = ssl.create_default_context(cafile=ca_file if ca_file and os.path.exists(ca_file) else None)
+
+    @classmethod
+    def from_config(cls):
+        if not config.k8s_api_url:
+            raise ValueError('K8S_API_URL is not set')
+        return cls(config.k8s_api_url, config.k8s_token_file, config.k8s_ca_file)
+
+    def get_token(self):
+        # service account tokens are rotated by kubelet, so the file is read on every request
+        if self.token_file and os.path.exists(self.token_file):
+            with open(self.token_file) as f:
+                return f.read().strip()
+        return None
+
+    def request(self, method, path, body=None, content_type='application/json'):
+        headers = {'Accept': 'application/json'}
+        token = self.get_token()
+        if token:
+            headers['Authorization'] = 'Bearer ' + token
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = content_type
+
+        req = urllib.request.Request(self.url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout,
+                                        context=self.ssl_context if self.url.startswith('https:') else None) as resp:
+                return json.loads(resp.read().decode('utf-8') or 'null')
+        except urllib.error.HTTPError as e:
+            raise ApiError(get_error_message(e), e.code) from e
+        except (urllib.error.URLError, OSError) as e:
+            raise ApiError(str(getattr(e, 'reason', e))) from e
+
+    def apply_secret(self, secret):
+        namespace = urllib.parse.quote(secret['metadata']['namespace'], safe='')
+        name = urllib.parse.quote(secret['metadata']['name'], safe='')
+        path = '/api/v1/namespaces/{}/secrets'.format(namespace)
+
+        # merge patch keeps labels and keys added by others, null values remove stale keys
+        try:
+            return self.request('PATCH', '{}/{}'.format(path, name), secret,
+                                content_type='application/merge-patch+json')
+        except ApiError as e:
+            if e.status != 404:
+                raise
+
+        secret = dict(secret, data={k: v for k, v in secret['data'].items() if v is not None})
+        return self.request('POST', path, secret)
+
+
+def get_error_message(e):
+    try:
+        return json.loads(e.read().decode('utf-8'))['message']
+    except (ValueError, KeyError, TypeError, OSError):
+        return '{} {}'.format(e.code, e.reason)
+
+
+class Report:
+    def __init__(self):
+        self.synced = 0
+        self.failed = []
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def as_dict(self):
+        return {
+            'synced': self.synced,
+            'failed': self.failed,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+    def __str__(self):
+        return '{} secrets synced, {} failed in {:.1f}s'.format(self.synced, len(self.failed), self.elapsed)
+
+
+def parse_secret_ref(ref):
+    namespace, _, name = ref.rpartition('/')
+    return namespace or config.k8s_namespace, name
+
+
+def build_secret(identity):
+    pair = identity.pair
+    item = {
+        'id': identity.id,
+        'name': identity.name,
+        'cert': x509.cert_to_pem(pair.cert),
+        'key': x509.key_to_pem(pair.key),
+        'chain': b''.join(x509.cert_to_pem(cert) for cert in identity.get_cert_chain()[1:]),
+    }
+    data = export.get_secret_data(item)
+    data.setdefault('ca.crt', None)
+
+    namespace, name = parse_secret_ref(identity.k8s_secret)
+    return {
+        'apiVersion': 'v1',
+        'kind': 'Secret',
+        'type': 'kubernetes.io/tls',
+        'metadata': {
+            'name': name,
+            'namespace': namespace,
+            'labels': {'myca/identity-id': str(identity.id)},
+            'annotations': {'myca/pair-id': str(pair.id), 'myca/serial': pair.serial},
+        },
+        'data': data,
+    }
+
+
+def query_pending():
+    return Identity.query.filter(Identity.k8s_secret.isnot(None),
+                                 Identity.current_pair_id.isnot(None),
+                                 or_(Identity.synced_pair_id.is_(None),
+                                     Identity.synced_pair_id != Identity.current_pair_id))
+
+
+def sync(client=None, batch_size=None, progress=None):
+    client = client or Client.from_config()
+    batch_size = batch_size or config.k8s_sync_batch_size
+    report = Report()
+
+    last_id = 0
+    while True:
+        identities = query_pending().filter(Identity.id > last_id).order_by(Identity.id).limit(batch_size).all()
+        if not identities:
+            break
+        Identity.prefetch_pairs(identities)
+
+        for identity in identities:
+            try:
+                client.apply_secret(build_secret(identity))
+            except ApiError as e:
+                if e.retryable:
+                    # keep what is synced so far, the caller retries the rest later
+                    db.session.commit()
+                    raise
+                log.warning('Failed to sync secret %s of %s: %s', identity.k8s_secret, identity.name, e)
+                report.failed.append({
+                    'id': identity.id,
+                    'name': identity.name,
+                    'secret': identity.k8s_secret,
+                    'error': str(e),
+                })
+            else:
+                identity.synced_pair_id = identity.current_pair_id
+                report.synced += 1
+
+        db.session.commit()
+        last_id = identities[-1].id
+        if progress:
+            progress(report)
+
+    report.finished_at = time.monotonic()
+    return report
+
+
+class Backoff:
+    def __init__(self, initial=1, maximum=None):
+        self.initial = initial
+        self.maximum = maximum or config.k8s_sync_max_backoff
+        self.failures = 0
+
+    def next(self):
+        self.failures += 1
+        delay = min(self.maximum, self.initial * 2 ** (self.failures - 1))
+        return delay * random.uniform(0.5, 1)
+
+    def reset(self):
+        self.failures = 0
+
+
+def run(interval=None, batch_size=None, wakeup=None):
+    interval = interval or config.k8s_sync_interval
+    client = Client.from_config()
+    backoff = Backoff()
+
+    log.info('Starting Kubernetes secret sync to %s', client.url)
+    while True:
+        try:
+            report = sync(client, batch_size=batch_size)
+        except ApiError as e:
+            delay = backoff.next()
+            log.warning('Kubernetes API error, retrying in %.1fs: %s', delay, e)
+            time.sleep(delay)
+            continue
+        except Exception:
+            db.session.rollback()
+            log.exception('Failed to sync secrets')
+        else:
+            backoff.reset()
+            if report.synced or report.failed:
+                log.info('%s', report)
+        finally:
+            db.session.remove()
+
+        if wakeup:
+            wakeup.wait(interval)
+            wakeup.clear()
+        else:
+            time.sleep(interval)
+
+
+# background sync in the committing process, woken up by commits which may have changed current pairs
+class Syncer:
+    def __init__(self):
+        self.app = None
+        self._pid = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+
+    def notify(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._wakeup = threading.Event()
+                self._thread = threading.Thread(target=self._run, name='k8s-sync', daemon=True)
+                self._thread.start()
+        if threading.current_thread() is not self._thread:
+            self._wakeup.set()
+
+    def _run(self):
+        with self.app.app_context():
+            run(wakeup=self._wakeup)
+
+
+syncer = Syncer()
+
+
+def init_app(app):
+    if not config.k8s_sync_on_commit or not config.k8s_api_url:
+        return
+
+    syncer.app = app
+    event.listen(db.session, 'after_commit', lambda session: syncer.notify())
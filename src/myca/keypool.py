@@ -0,0 +1,98 @@
+import os
+import logging
+import queue
+import threading
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
+
+from myca import config
+
+log = logging.getLogger(__name__)
+
+
+CURVES = {
+    'ecdsa-p256': ec.SECP256R1,
+    'ecdsa-p384': ec.SECP384R1,
+    'ecdsa-p521': ec.SECP521R1,
+}
+KEY_TYPES = ['rsa'] + list(CURVES) + ['ed25519']
+
+
+def generate_private_key(key_type, public_exponent=None, key_size=None):
+    if key_type == 'rsa':
+        return rsa.generate_private_key(public_exponent=public_exponent, key_size=key_size, backend=default_backend())
+    if key_type in CURVES:
+        return ec.generate_private_key(CURVES[key_type](), default_backend())
+    if key_type == 'ed25519':
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError('Unsupported key type: {}'.format(key_type))
+
+
+class KeyPool:
+    def __init__(self, size, workers=1):
+        self.size = size
+        self.workers = workers
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def generate_private_key(self, key_type, public_exponent=None, key_size=None):
+        params = key_type, public_exponent, key_size
+        q = self._get_queue(params)
+
+        if q is not None:
+            try:
+                return q.get_nowait()
+            except queue.Empty:
+                pass
+            log.info('Key pool %s is empty, generating key inline', params)
+
+        key = generate_private_key(*params)
+        if q is None:
+            self.fill(*params)
+        return key
+
+    def fill(self, key_type, public_exponent=None, key_size=None):
+        params = key_type, public_exponent, key_size
+
+        with self._lock:
+            self._check_fork()
+            if self.size <= 0 or params in self._queues:
+                return
+
+            q = self._queues[params] = queue.Queue(self.size)
+            for i in range(self.workers):
+                name = 'keypool-{}-{}'.format('-'.join(str(p) for p in params if p is not None), i)
+                thread = threading.Thread(target=self._fill, args=(params, q), name=name, daemon=True)
+                thread.start()
+
+    def qsize(self, key_type, public_exponent=None, key_size=None):
+        q = self._get_queue((key_type, public_exponent, key_size))
+        return q.qsize() if q else 0
+
+    def _get_queue(self, params):
+        with self._lock:
+            self._check_fork()
+            return self._queues.get(params)
+
+    def _check_fork(self):
+        # filler threads do not survive fork, so child processes start with empty pools
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._queues = {}
+
+    def _fill(self, params, q):
+        while True:
+            try:
+                key = generate_private_key(*params)
+            except Exception:
+                log.exception('Failed to generate key for pool %s', params)
+                with self._lock:
+                    if self._queues.get(params) is q:
+                        del self._queues[params]
+                return
+            q.put(key)
+
+
+pool = KeyPool(config.key_pool_size, config.key_pool_workers)
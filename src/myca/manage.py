@@ -1,9 +1,13 @@
+import sys
+import csv
+import json
 import logging
 import pathlib
+import datetime
 import importlib.machinery
 import importlib.util
 
-from flask_script import Manager
+from flask_script import Manager, Command, Option
 from flask_migrate import MigrateCommand
 
 from myca import config
@@ -13,6 +17,277 @@ manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
 
+@manager.option('-c', '--concurrency', dest='concurrency', type=int, default=None,
+                help='Number of issuing processes (defaults to number of CPUs)')
+@manager.option('--burst', dest='burst', action='store_true', help='Exit when there are no more pending jobs')
+def worker(concurrency=None, burst=False):
+    """Run issuance job worker"""
+    from myca import worker as job_worker
+    job_worker.run(concurrency=concurrency, burst=burst)
+
+
+@manager.option('-b', '--bind', dest='bind', default=None, help='Address to listen on (defaults to SERVE_BIND)')
+@manager.option('-w', '--workers', dest='workers', type=int, default=None,
+                help='Number of worker processes (defaults to number of CPUs)')
+@manager.option('-t', '--threads', dest='threads', type=int, default=None,
+                help='Number of threads per worker (defaults to SERVE_THREADS)')
+@manager.option('--max-requests', dest='max_requests', type=int, default=None,
+                help='Restart a worker after this number of requests, 0 to disable (defaults to SERVE_MAX_REQUESTS)')
+@manager.option('--timeout', dest='timeout', type=int, default=None,
+                help='Restart a worker silent for this number of seconds (defaults to SERVE_TIMEOUT)')
+@manager.option('--graceful-timeout', dest='graceful_timeout', type=int, default=None,
+                help='Seconds to finish requests in flight on shutdown (defaults to SERVE_GRACEFUL_TIMEOUT)')
+def serve(bind=None, workers=None, threads=None, max_requests=None, timeout=None, graceful_timeout=None):
+    """Run multi-process production server"""
+    from myca import server
+
+    server.run(app, bind=bind, workers=workers, threads=threads, max_requests=max_requests, timeout=timeout,
+               graceful_timeout=graceful_timeout)
+
+
+@manager.option('-f', '--fraction', dest='fraction', type=float, default=None,
+                help='Renew once this fraction of the certificate lifetime has passed (defaults to RENEW_FRACTION)')
+@manager.option('-j', '--jitter', dest='jitter', type=float, default=None,
+                help='Renew up to this fraction of the lifetime earlier, spread by pair (defaults to RENEW_JITTER)')
+@manager.option('-r', '--rate', dest='rate', type=int, default=None,
+                help='Maximum renewals per minute, 0 for unlimited (defaults to RENEW_RATE)')
+@manager.option('--include-roots', dest='include_roots', action='store_true',
+                help='Renew self-signed root CAs too, which replaces the trust anchor')
+@manager.option('--once', dest='once', action='store_true', help='Exit after a single pass')
+@manager.option('-n', '--dry-run', dest='dry_run', action='store_true', help='Only list identities due for renewal')
+def renewer(fraction=None, jitter=None, rate=None, include_roots=False, once=False, dry_run=False):
+    """Renew certificates once a fraction of their lifetime has passed"""
+    from myca import renewer as daemon
+
+    if dry_run:
+        for candidate in daemon.find_due(fraction=fraction, jitter=jitter, include_roots=include_roots):
+            print('{:%Y-%m-%d %H:%M:%S} {:>6} {} ({})'.format(candidate.renew_at, candidate.identity_id, candidate.name,
+                                                            candidate.reason))
+        return
+
+    daemon.run(fraction=fraction, jitter=jitter, rate=rate, include_roots=include_roots, once=once)
+
+
+class K8sSyncCommand(Command):
+    """Push current certificates into their Kubernetes Secrets"""
+
+    option_list = [
+        Option('-i', '--interval', dest='interval', type=float, default=None,
+               help='Seconds between sync passes (defaults to K8S_SYNC_INTERVAL)'),
+        Option('-b', '--batch-size', dest='batch_size', type=int, default=None,
+               help='Number of Secrets pushed per transaction'),
+        Option('--once', dest='once', action='store_true', help='Exit after a single pass'),
+        Option('--json', dest='as_json', action='store_true', help='Print summary report of a single pass as JSON'),
+    ]
+
+    def run(self, interval=None, batch_size=None, once=False, as_json=False):
+        from myca import k8s
+
+        if not config.k8s_api_url:
+            print('K8S_API_URL is required outside of a cluster', file=sys.stderr)
+            sys.exit(2)
+
+        if not once:
+            k8s.run(interval=interval, batch_size=batch_size)
+            return
+
+        try:
+            report = k8s.sync(batch_size=batch_size, progress=lambda r: print(r, file=sys.stderr))
+        except k8s.ApiError as e:
+            print('Kubernetes API error: {}'.format(e), file=sys.stderr)
+            sys.exit(1)
+
+        if as_json:
+            print(json.dumps(report.as_dict(), indent=2))
+        else:
+            print(report)
+            for failure in report.failed:
+                print('{name} {secret}: {error}'.format(**failure))
+
+        if report.failed:
+            sys.exit(1)
+
+
+manager.add_command('k8s-sync', K8sSyncCommand())
+
+
+@manager.option('-i', '--issuer', dest='issuer_id', type=int, default=None,
+                help='Reissue subtree of the issuer identity with this ID')
+@manager.option('--children-only', dest='children_only', action='store_true',
+                help='Do not reissue the issuer itself')
+@manager.option('-e', '--expiring-days', dest='expiring_days', type=int, default=None,
+                help='Reissue certificates expiring within this number of days')
+@manager.option('-c', '--concurrency', dest='concurrency', type=int, default=None,
+                help='Number of key generating processes (defaults to number of CPUs)')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=None,
+                help='Number of reissued certificates per transaction')
+@manager.option('-n', '--dry-run', dest='dry_run', action='store_true', help='Only list selected identities')
+@manager.option('--json', dest='as_json', action='store_true', help='Print summary report as JSON')
+def reissue(issuer_id=None, children_only=False, expiring_days=None, concurrency=None, batch_size=None,
+            dry_run=False, as_json=False):
+    """Reissue certificates of an issuer subtree or expiring within a window"""
+    from myca import bulk
+
+    if issuer_id is None and expiring_days is None:
+        print('Either --issuer or --expiring-days is required', file=sys.stderr)
+        sys.exit(2)
+
+    expiring_within = datetime.timedelta(days=expiring_days) if expiring_days is not None else None
+    identities = bulk.select(issuer_id, include_issuer=not children_only, expiring_within=expiring_within)
+
+    if dry_run:
+        for identity in identities:
+            print(identity.id, identity.name)
+        return
+
+    report = bulk.reissue(identities, concurrency=concurrency, batch_size=batch_size,
+                          progress=lambda r: print(r, file=sys.stderr))
+
+    if as_json:
+        print(json.dumps(report.as_dict(), indent=2))
+    else:
+        print(report)
+        for failure in report.failed:
+            print('{id} {name}: {error}'.format(**failure))
+
+    if report.failed:
+        sys.exit(1)
+
+
+@manager.option('-d', '--days', dest='days', type=int, default=30, help='Expiration window in days')
+@manager.option('-f', '--format', dest='output_format', choices=['text', 'json', 'csv'], default='text',
+                help='Output format')
+def expiring(days=30, output_format='text'):
+    """List identities whose certificates expire within a window"""
+    from myca import expiry
+
+    items = expiry.find_expiring(datetime.timedelta(days=days))
+
+    if output_format == 'json':
+        print(json.dumps(items, indent=2, default=lambda v: v.isoformat()))
+    elif output_format == 'csv':
+        writer = csv.DictWriter(sys.stdout, fieldnames=['id', 'name', 'issuer_id', 'serial', 'is_ca', 'not_after',
+                                                        'expires_at', 'status', 'cause_id', 'cause_name'])
+        writer.writeheader()
+        writer.writerows(items)
+    else:
+        for item in items:
+            line = '{expires_at:%Y-%m-%d %H:%M:%S}  {status:<16} {id:>6} {name}'.format(**item)
+            if item['cause_name']:
+                line += ' (issuer {})'.format(item['cause_name'])
+            print(line)
+
+
+@manager.option('-k', '--keep', dest='keep', type=int, default=None,
+                help='Number of latest pairs kept per identity (defaults to PAIR_RETENTION_COUNT)')
+@manager.option('-d', '--days', dest='keep_days', type=int, default=None,
+                help='Keep pairs issued within this number of days (defaults to PAIR_RETENTION_DAYS)')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=None,
+                help='Number of pairs archived per transaction')
+@manager.option('-n', '--dry-run', dest='dry_run', action='store_true', help='Only count pairs to archive')
+@manager.option('--json', dest='as_json', action='store_true', help='Print summary report as JSON')
+def archive(keep=None, keep_days=None, batch_size=None, dry_run=False, as_json=False):
+    """Move pairs beyond the retention policy into the archive table and delete unreferenced blobs"""
+    from myca import retention
+
+    keep = keep if keep is not None else config.pair_retention_count
+    keep_days = keep_days if keep_days is not None else config.pair_retention_days
+    if not keep and not keep_days:
+        print('Either --keep or --days is required', file=sys.stderr)
+        sys.exit(2)
+
+    if dry_run:
+        print(retention.query_expired(keep, keep_days).count())
+        return
+
+    report = retention.archive(keep, keep_days, batch_size=batch_size, progress=lambda r: print(r, file=sys.stderr))
+    if as_json:
+        print(json.dumps(report.as_dict(), indent=2))
+    else:
+        print(report)
+
+
+class ImportCommand(Command):
+    """Import certificates and keys from PEM bundles, directories and tar archives"""
+
+    option_list = [
+        Option('paths', nargs='+', metavar='PATH', help='PEM bundle, directory or tar archive'),
+        Option('-b', '--batch-size', dest='batch_size', type=int, default=None,
+               help='Number of imported identities per transaction'),
+        Option('--json', dest='as_json', action='store_true', help='Print summary report as JSON'),
+    ]
+
+    def run(self, paths, batch_size=None, as_json=False):
+        from myca import importing
+
+        files = (item for path in paths for item in importing.iter_path(path))
+        report = importing.import_many(files, batch_size=batch_size, progress=lambda r: print(r, file=sys.stderr))
+
+        if as_json:
+            print(json.dumps(report.as_dict(), indent=2))
+        else:
+            print(report)
+            for failure in report.failed:
+                print('{source} {name}: {error}'.format(**failure))
+
+        if report.failed:
+            sys.exit(1)
+
+
+manager.add_command('import', ImportCommand())
+
+
+class VerifyAllCommand(Command):
+    """Verify certificate chains of all identities"""
+
+    option_list = [
+        Option('-c', '--concurrency', dest='concurrency', type=int, default=None,
+               help='Number of verifying processes (defaults to number of CPUs)'),
+        Option('-b', '--batch-size', dest='batch_size', type=int, default=None,
+               help='Number of certificates verified per task'),
+        Option('-o', '--output', dest='output', default='-', help='JSON report file (defaults to stdout)'),
+    ]
+
+    def run(self, concurrency=None, batch_size=None, output='-'):
+        from myca import verification
+
+        report = verification.verify_all(concurrency=concurrency, batch_size=batch_size)
+        print(report, file=sys.stderr)
+
+        if output == '-':
+            print(json.dumps(report.as_dict(), indent=2))
+        else:
+            with open(output, 'w') as f:
+                json.dump(report.as_dict(), f, indent=2)
+
+        if report.invalid:
+            sys.exit(1)
+
+
+manager.add_command('verify-all', VerifyAllCommand())
+
+
+@manager.option('-f', '--format', dest='export_format', choices=['tar', 'tgz', 'zip', 'k8s'], default='tgz',
+                help='Archive format or Kubernetes Secret manifests')
+@manager.option('-i', '--issuer', dest='issuer_id', type=int, default=None,
+                help='Export only subtree of the issuer identity with this ID')
+@manager.option('-n', '--namespace', dest='namespace', default=None, help='Kubernetes namespace of the Secrets')
+@manager.option('-o', '--output', dest='output', default='-', help='Output file (defaults to stdout)')
+def export(export_format='tgz', issuer_id=None, namespace=None, output='-'):
+    """Export current certificates, keys and chains"""
+    from myca import models, export as exporter
+
+    models.db.use_replica()
+
+    f = sys.stdout.buffer if output == '-' else open(output, 'wb')
+    try:
+        for chunk in exporter.stream(export_format, issuer_id=issuer_id, namespace=namespace):
+            f.write(chunk)
+    finally:
+        if f is not sys.stdout.buffer:
+            f.close()
+
+
 def run():
     logging.basicConfig(level='NOTSET')
     load_plugins()
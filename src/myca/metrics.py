@@ -0,0 +1,308 @@
+import os
+import glob
+import json
+import time
+import uuid
+import fcntl
+import inspect
+import logging
+import threading
+import functools
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from myca import config, x509, keypool
+
+log = logging.getLogger(__name__)
+
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# per-request accumulators of the current thread, None outside of requests
+current = threading.local()
+
+
+class Histogram:
+    def __init__(self, name, description, labels=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            counts, total = self._values.get(label_values) or ([0] * (len(self.buckets) + 1), 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._values[label_values] = counts, total + value
+
+    def get_values(self):
+        with self._lock:
+            return {label_values: (list(counts), total) for label_values, (counts, total) in self._values.items()}
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def render(self, values=None):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.description),
+            '# TYPE {} histogram'.format(self.name),
+        ]
+        values = sorted((self.get_values() if values is None else values).items())
+
+        for label_values, (counts, total) in values:
+            labels = ['{}="{}"'.format(k, escape(v)) for k, v in zip(self.labels, label_values)]
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                bucket_labels = ','.join(labels + ['le="{}"'.format(bound)])
+                lines.append('{}_bucket{{{}}} {}'.format(self.name, bucket_labels, count))
+            suffix = '{{{}}}'.format(','.join(labels)) if labels else ''
+            lines.append('{}_sum{} {}'.format(self.name, suffix, total))
+            lines.append('{}_count{} {}'.format(self.name, suffix, counts[-1]))
+        return lines
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+function_seconds = Histogram('myca_function_seconds', 'Time spent in instrumented functions', ['function'])
+sql_query_seconds = Histogram('myca_sql_query_seconds', 'SQL statement execution time')
+request_seconds = Histogram('myca_request_seconds', 'Request handling time', ['endpoint', 'method'])
+request_sql_queries = Histogram('myca_request_sql_queries', 'SQL statements per request', ['endpoint'],
+                                buckets=COUNT_BUCKETS)
+request_sql_seconds = Histogram('myca_request_sql_seconds', 'SQL time per request', ['endpoint'])
+
+HISTOGRAMS = [function_seconds, sql_query_seconds, request_seconds, request_sql_queries, request_sql_seconds]
+
+
+def merge_values(target, values):
+    for label_values, (counts, total) in values.items():
+        merged_counts, merged_total = target.get(label_values) or ([0] * len(counts), 0)
+        target[label_values] = [a + b for a, b in zip(merged_counts, counts)], merged_total + total
+
+
+class SharedStore:
+    # workers behind one socket answer scrapes in turn, so each saves its histograms into a shared directory
+    # and the one answering adds up all files; files of exited workers are folded into one, as counts only grow
+    RETIRED = 'retired.json'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._pid = None
+        self._path = None
+        self._lock = threading.Lock()
+
+    def clear(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            os.remove(path)
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._path = os.path.join(self.directory, '{}-{}.json'.format(self._pid, uuid.uuid4().hex[:8]))
+                threading.Thread(target=self._run, name='metrics-flush', daemon=True).start()
+
+    def _run(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(config.metrics_flush_interval)
+            self.save()
+
+    def save(self):
+        with self._lock:
+            if self._path is None or self._pid != os.getpid():
+                return
+            write_values(self._path, {histogram.name: histogram.get_values() for histogram in HISTOGRAMS})
+
+    def collect(self):
+        values = {histogram.name: {} for histogram in HISTOGRAMS}
+        with self.locked(fcntl.LOCK_SH):
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                for name, histogram_values in read_values(path).items():
+                    merge_values(values.setdefault(name, {}), histogram_values)
+        return values
+
+    def retire(self):
+        with self._lock:
+            path, self._path, self._pid = self._path, None, None
+        if path is None:
+            return
+
+        retired_path = os.path.join(self.directory, self.RETIRED)
+        with self.locked(fcntl.LOCK_EX):
+            values = read_values(retired_path)
+            for histogram in HISTOGRAMS:
+                merge_values(values.setdefault(histogram.name, {}), histogram.get_values())
+            write_values(retired_path, values)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def locked(self, operation):
+        return FileLock(os.path.join(self.directory, '.lock'), operation)
+
+
+class FileLock:
+    def __init__(self, path, operation):
+        self.path = path
+        self.operation = operation
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        fcntl.flock(self.file, self.operation)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def write_values(path, values):
+    data = {name: [[list(label_values), counts, total] for label_values, (counts, total) in histogram_values.items()]
+            for name, histogram_values in values.items()}
+    # replaced at once, readers never see a partly written file
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def read_values(path):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {name: {tuple(label_values): (counts, total) for label_values, counts, total in items}
+            for name, items in data.items()}
+
+
+store = None
+
+
+def share(directory):
+    global store
+    store = SharedStore(directory)
+    store.clear()
+    # histograms of the master would otherwise be counted again by every forked worker
+    os.register_at_fork(after_in_child=reset)
+
+
+def reset():
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+
+
+def retire():
+    if store is not None:
+        store.retire()
+
+
+class RequestStats:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.sql_queries = 0
+        self.sql_seconds = 0
+        self.functions = {}
+
+
+def instrument(func, name):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            function_seconds.observe(elapsed, name)
+            stats = getattr(current, 'request', None)
+            if stats is not None:
+                calls, total = stats.functions.get(name, (0, 0))
+                stats.functions[name] = calls + 1, total + elapsed
+    return wrapper
+
+
+def instrument_module(module, names=None):
+    # patching module attributes covers callers, which all go through `module.func`, and calls inside the module
+    prefix = module.__name__.rsplit('.', 1)[-1]
+    for name, value in list(vars(module).items()):
+        if names is not None and name not in names:
+            continue
+        if inspect.isfunction(value) and value.__module__ == module.__name__ and not name.startswith('_'):
+            setattr(module, name, instrument(value, '{}.{}'.format(prefix, name)))
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started_at'].pop()
+    sql_query_seconds.observe(elapsed)
+    stats = getattr(current, 'request', None)
+    if stats is not None:
+        stats.sql_queries += 1
+        stats.sql_seconds += elapsed
+
+
+def before_request():
+    if store is not None:
+        store.start()
+    current.request = RequestStats()
+
+
+def teardown_request(exc=None):
+    stats = getattr(current, 'request', None)
+    if stats is None:
+        return
+    current.request = None
+
+    elapsed = time.perf_counter() - stats.started_at
+    endpoint = request.endpoint or 'unknown'
+    request_seconds.observe(elapsed, endpoint, request.method)
+    request_sql_queries.observe(stats.sql_queries, endpoint)
+    request_sql_seconds.observe(stats.sql_seconds, endpoint)
+
+    if config.slow_request_threshold and elapsed >= config.slow_request_threshold:
+        functions = sorted(stats.functions.items(), key=lambda item: item[1][1], reverse=True)
+        log.warning('Slow request %s %s (%s): %.3fs, %d SQL statements in %.3fs; %s',
+                    request.method, request.path, endpoint, elapsed, stats.sql_queries, stats.sql_seconds,
+                    ', '.join('{} {}x {:.3f}s'.format(name, calls, total) for name, (calls, total) in functions))
+
+
+def metrics_view():
+    values = {}
+    if store is not None:
+        store.save()
+        values = store.collect()
+
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render(values.get(histogram.name))
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    # nothing is patched or hooked unless enabled, so disabled metrics cost nothing
+    if not config.metrics_enabled and not config.slow_request_threshold:
+        return
+
+    instrument_module(x509)
+    instrument_module(keypool, ['generate_private_key'])
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+    app.before_request(before_request)
+    app.teardown_request(teardown_request)
+
+    if config.metrics_enabled:
+        app.add_url_rule('/metrics', 'metrics', metrics_view)
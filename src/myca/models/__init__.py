@@ -1,3 +1,6 @@
 from .db import db
+from .blob import Blob
 from .identity import Identity
 from .pair import Pair
+from .job import Job
+from .pair_archive import PairArchive
@@ -0,0 +1,46 @@
+import hashlib
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.dialects import postgresql
+
+from .db import db
+
+
+class Blob(db.Model):
+    digest = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Binary, nullable=False)
+
+    def __repr__(self):
+        return '<Blob {}>'.format(self.digest)
+
+    @classmethod
+    def get_or_create(cls, data):
+        digest = hashlib.sha256(data).hexdigest()
+
+        # blobs of this session are answered from the identity map, so the query does not flush unrelated changes
+        with db.session.no_autoflush:
+            blob = cls.query.get(digest)
+        if blob is None:
+            cls.insert(digest, data)
+            blob = cls(digest=digest, data=data)
+            make_transient_to_detached(blob)
+            db.session.add(blob)
+        return blob
+
+    @classmethod
+    def insert(cls, digest, data):
+        # the row is inserted right away, so concurrent transactions storing the same content don't conflict on commit
+        if db.session.get_bind(cls.__mapper__).dialect.name == 'postgresql':
+            stmt = postgresql.insert(cls.__table__).values(digest=digest, data=data) \
+                .on_conflict_do_nothing(index_elements=['digest'])
+            db.session.execute(stmt)
+            return
+
+        stmt = cls.__table__.insert().values(digest=digest, data=data)
+        connection = db.session.connection(clause=stmt)
+        try:
+            with connection.begin_nested():
+                connection.execute(stmt)
+        except IntegrityError:
+            pass
@@ -1,2 +1,85 @@
-from flask_sqlalchemy import SQLAlchemy
+import time
+import sqlite3
+
+import flask
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.sql.expression import Select, CompoundSelect
+
+from myca import config
+
+REPLICA_BIND = 'replica'
+
+
+def has_replica():
+    # a replica URI pointing at the primary, as in single-node setups, is not a replica
+    return bool(config.database_replica_uri) and make_url(config.database_replica_uri) != make_url(config.database_uri)
+
+
+# pysqlite begins transactions on its own and breaks SAVEPOINT, let SQLAlchemy emit BEGIN instead
+@event.listens_for(Engine, 'connect')
+def sqlite_connect(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.isolation_level = None
+
+
+@event.listens_for(Engine, 'begin')
+def sqlite_begin(conn):
+    if conn.dialect.name == 'sqlite':
+        conn.execute('BEGIN')
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        # plain reads only, and never after this session has written something it may read back
+        if self.info.get('replica') and not self.info.get('wrote') and not self._flushing \
+                and isinstance(clause, (Select, CompoundSelect)):
+            return get_state(self.app).db.get_engine(self.app, bind=REPLICA_BIND)
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def after_flush(session, flush_context):
+    session.info['wrote'] = True
+    # following requests of the same browser, like the one after a redirect, read from the primary
+    # till the replica has caught up
+    if session.info.get('remember_writes') and has_replica() and flask.has_request_context():
+        flask.session['db_primary_until'] = time.time() + config.database_replica_lag
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def init_app(self, app):
+        if has_replica():
+            app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA_BIND] = config.database_replica_uri
+        super().init_app(app)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        if sa_url.drivername.startswith('postgres'):
+            pg_options = []
+            if config.database_statement_timeout:
+                pg_options.append('-c statement_timeout={}'.format(int(config.database_statement_timeout * 1000)))
+            if has_replica() and sa_url == make_url(config.database_replica_uri):
+                pg_options.append('-c default_transaction_read_only=on')
+            if pg_options:
+                options.setdefault('connect_args', {})['options'] = ' '.join(pg_options)
+
+        return super().apply_driver_hacks(app, sa_url, options)
+
+    def remember_writes(self):
+        # for browser sessions only, API clients ask for fresh reads with Cache-Control
+        self.session.info['remember_writes'] = True
+
+    def use_replica(self):
+        if not has_replica():
+            return
+        if flask.has_request_context() and flask.session.get('db_primary_until', 0) > time.time():
+            return
+        self.session.info['replica'] = True
+
+
 db = SQLAlchemy()
@@ -1,6 +1,9 @@
+from sqlalchemy import func
+from sqlalchemy.orm import validates
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.schema import UniqueConstraint
 
-from myca import x509
+from myca import x509, signer
 from .db import db
 
 
@@ -12,6 +15,13 @@ class Identity(db.Model):
 
     name = db.Column(db.String(255), nullable=False)
 
+    current_pair_id = db.Column(db.Integer, db.ForeignKey('pair.id', use_alter=True,
+                                                          name='identity_current_pair_id_fkey'), nullable=True)
+    current_pair = db.relationship('Pair', foreign_keys=[current_pair_id], post_update=True)
+
+    k8s_secret = db.Column(db.String(317), nullable=True)
+    synced_pair_id = db.Column(db.Integer, nullable=True)
+
     __table_args__ = (
         UniqueConstraint('issuer_id', 'name', name='_issuer_name_uc'),
     )
@@ -24,32 +34,124 @@ class Identity(db.Model):
 
     @property
     def pair(self):
-        from . import Pair
-        return self.pairs.order_by(Pair.issued_at.desc()).first()
+        return self.current_pair
 
     @pair.setter
     def pair(self, pair):
+        if self.current_pair_id is not None:
+            signer.invalidate(self.current_pair_id)
         pair.identity = self
         db.session.add(pair)
+        self.current_pair = pair
+        self.__dict__.pop('_pair_error', None)
+
+    @validates('k8s_secret')
+    def validate_k8s_secret(self, key, value):
+        if value != self.k8s_secret:
+            self.synced_pair_id = None
+        return value
 
     @property
     def pair_error(self):
-        cert_chain = self.get_cert_chain()
-
-        if len(cert_chain) > 1:
-            cert_chain = cert_chain[1:]
+        if '_pair_error' not in self.__dict__:
+            self.load_pair_errors([self])
+        return self._pair_error
 
+    @property
+    def job(self):
         try:
-            x509.verify_certificate_chain(self.pair.cert, cert_chain)
-        except x509.InvalidCertificate as e:
-            return str(e)
+            return self._job
+        except AttributeError:
+            pass
+
+        from . import Job
+        return self.jobs.order_by(Job.id.desc()).first()
 
     def get_cert_chain(self):
         chain = []
 
         issuer = self
-        while issuer:
+        while issuer and issuer.pair:
             chain.append(issuer.pair.cert)
             issuer = issuer.issuer
 
         return chain
+
+    @classmethod
+    def query_subtree(cls, issuer_id, include_issuer=True):
+        subtree = db.session.query(cls.id).filter(cls.id == issuer_id).cte(recursive=True)
+        subtree = subtree.union(db.session.query(cls.id).join(subtree, cls.issuer_id == subtree.c.id))
+
+        query = cls.query.filter(cls.id.in_(db.session.query(subtree.c.id)))
+        if not include_issuer:
+            query = query.filter(cls.id != issuer_id)
+        return query
+
+    @classmethod
+    def prefetch_pairs(cls, identities):
+        from . import Pair
+
+        identities = [identity for identity in identities if identity.id is not None]
+        if not identities:
+            return
+
+        ancestors = db.session.query(cls.issuer_id.label('id')) \
+            .filter(cls.id.in_([identity.id for identity in identities])) \
+            .cte(recursive=True)
+        ancestors = ancestors.union(db.session.query(cls.issuer_id).join(ancestors, cls.id == ancestors.c.id))
+
+        by_id = {identity.id: identity for identity in identities}
+        for identity in cls.query.filter(cls.id.in_(db.session.query(ancestors.c.id))):
+            by_id.setdefault(identity.id, identity)
+
+        pair_ids = [identity.current_pair_id for identity in by_id.values() if identity.current_pair_id]
+        pairs = {pair.id: pair for pair in Pair.query.filter(Pair.id.in_(pair_ids))} if pair_ids else {}
+
+        for identity in by_id.values():
+            set_committed_value(identity, 'current_pair', pairs.get(identity.current_pair_id))
+            set_committed_value(identity, 'issuer', by_id.get(identity.issuer_id))
+
+    @classmethod
+    def load_pair_errors(cls, identities):
+        cls.prefetch_pairs(identities)
+
+        stores = {}
+        for identity in identities:
+            if identity.pair is None:
+                identity._pair_error = 'Certificate is not issued'
+                continue
+
+            if identity.pair.revoked_at:
+                identity._pair_error = 'Certificate is revoked'
+                continue
+
+            cert_chain = identity.get_cert_chain()
+
+            if len(cert_chain) > 1:
+                cert_chain = cert_chain[1:]
+
+            cert_chain = tuple(cert_chain)
+            try:
+                if cert_chain not in stores:
+                    stores[cert_chain] = x509.create_certificate_store(cert_chain)
+                x509.verify_certificate(identity.pair.cert, stores[cert_chain])
+            except x509.InvalidCertificate as e:
+                identity._pair_error = str(e)
+            else:
+                identity._pair_error = None
+
+    @classmethod
+    def prefetch_jobs(cls, identities):
+        from . import Job
+
+        identities = [identity for identity in identities if identity.id is not None]
+        if not identities:
+            return
+
+        latest = db.session.query(func.max(Job.id)) \
+            .filter(Job.identity_id.in_([identity.id for identity in identities])) \
+            .group_by(Job.identity_id)
+        jobs = {job.identity_id: job for job in Job.query.filter(Job.id.in_(latest))}
+
+        for identity in identities:
+            identity._job = jobs.get(identity.id)
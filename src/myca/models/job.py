@@ -0,0 +1,42 @@
+import datetime
+
+from .db import db
+
+
+class Job(db.Model):
+    KIND_ISSUE = 'issue'
+    KIND_REISSUE = 'reissue'
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    identity_id = db.Column(db.Integer, db.ForeignKey('identity.id'), nullable=False)
+    identity = db.relationship('Identity', backref=db.backref('jobs', lazy='dynamic', cascade='all, delete-orphan'))
+
+    kind = db.Column(db.String(16), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default=STATUS_PENDING, index=True)
+    data = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __init__(self, kind, data=None):
+        self.kind = kind
+        self.data = data
+        self.status = self.STATUS_PENDING
+
+    def __repr__(self):
+        return '<Job {}>'.format(self.id)
+
+    def __str__(self):
+        return '{} {} ({})'.format(self.kind, self.identity, self.status)
+
+    @property
+    def is_active(self):
+        return self.status in (self.STATUS_PENDING, self.STATUS_RUNNING)
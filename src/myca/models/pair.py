@@ -3,41 +3,30 @@ import datetime
 from sqlalchemy.schema import UniqueConstraint
 
 from .db import db
+from .blob import Blob
 from myca import x509
 
 
-class Pair(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-
-    identity_id = db.Column(db.Integer, db.ForeignKey('identity.id'), nullable=False)
-    identity = db.relationship('Identity', backref=db.backref('pairs', lazy='dynamic', cascade='all, delete-orphan'))
-
-    issued_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-
-    cert = db.Column(db.Binary, nullable=False)
-    key = db.Column(db.Binary, nullable=False)
-
-    __table_args__ = (
-        UniqueConstraint('identity_id', 'issued_at', name='_identity_issued_at_uc'),
-    )
-
-    def __init__(self, cert, key):
-        self.cert = cert
-        self.key = key
-
-    def __repr__(self):
-        return '<Pair {}>'.format(self.id)
-
+# shared by current and archived pairs, which have the same blob relationships
+class PairMixin:
     def __str__(self):
         return '{} @ {}'.format(self.identity, self.issued_at)
 
+    @property
+    def cert(self):
+        return self.cert_blob.data
+
+    @property
+    def key(self):
+        return self.key_blob.data
+
     @property
     def cert_str(self):
-        return self.cert.decode('ascii')
+        return x509.cert_to_pem(self.cert).decode('ascii')
 
     @property
     def key_str(self):
-        return self.key.decode('ascii')
+        return x509.key_to_pem(self.key).decode('ascii')
 
     @property
     def cert_text(self):
@@ -46,3 +35,51 @@ class Pair(db.Model):
     @property
     def as_tuple(self):
         return self.cert, self.key
+
+
+class Pair(PairMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+
+    identity_id = db.Column(db.Integer, db.ForeignKey('identity.id'), nullable=False)
+    identity = db.relationship('Identity', foreign_keys=[identity_id],
+                               backref=db.backref('pairs', lazy='dynamic', cascade='all, delete-orphan'))
+
+    issued_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    # DER data is stored once per content and shared by reverted and reimported pairs
+    cert_digest = db.Column(db.String(64), db.ForeignKey('blob.digest'), nullable=False, index=True)
+    cert_blob = db.relationship(Blob, foreign_keys=[cert_digest], lazy='joined', innerjoin=True)
+    key_digest = db.Column(db.String(64), db.ForeignKey('blob.digest'), nullable=False, index=True)
+    key_blob = db.relationship(Blob, foreign_keys=[key_digest], lazy='joined', innerjoin=True)
+
+    not_before = db.Column(db.DateTime, nullable=True)
+    not_after = db.Column(db.DateTime, nullable=True, index=True)
+    serial = db.Column(db.String(40), nullable=True, index=True)
+    subject_cn = db.Column(db.String(255), nullable=True, index=True)
+    fingerprint = db.Column(db.String(64), nullable=True, index=True)
+    subject_key_id = db.Column(db.String(64), nullable=True, index=True)
+    authority_key_id = db.Column(db.String(64), nullable=True, index=True)
+    is_ca = db.Column(db.Boolean, nullable=True, index=True)
+    key_hash = db.Column(db.String(40), nullable=True, index=True)
+
+    revoked_at = db.Column(db.DateTime, nullable=True, index=True)
+    revocation_reason = db.Column(db.String(32), nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint('identity_id', 'issued_at', name='_identity_issued_at_uc'),
+    )
+
+    def __init__(self, cert, key):
+        self.cert_blob = Blob.get_or_create(x509.to_der(cert))
+        self.key_blob = Blob.get_or_create(x509.to_der(key))
+
+        for k, v in x509.get_certificate_metadata(self.cert).items():
+            setattr(self, k, v)
+
+    def __repr__(self):
+        return '<Pair {}>'.format(self.id)
+
+    def revoke(self, reason='unspecified'):
+        if self.revoked_at is None:
+            self.revoked_at = datetime.datetime.utcnow()
+            self.revocation_reason = reason
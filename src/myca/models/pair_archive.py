@@ -0,0 +1,44 @@
+import datetime
+
+from .db import db
+from .blob import Blob
+from .pair import PairMixin
+
+
+class PairArchive(PairMixin, db.Model):
+    __tablename__ = 'pair_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    identity_id = db.Column(db.Integer, db.ForeignKey('identity.id'), nullable=False, index=True)
+    identity = db.relationship('Identity', backref=db.backref('archived_pairs', lazy='dynamic',
+                                                              cascade='all, delete-orphan'))
+
+    issued_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    cert_digest = db.Column(db.String(64), db.ForeignKey('blob.digest'), nullable=False)
+    cert_blob = db.relationship(Blob, foreign_keys=[cert_digest], lazy='joined', innerjoin=True)
+    key_digest = db.Column(db.String(64), db.ForeignKey('blob.digest'), nullable=False)
+    key_blob = db.relationship(Blob, foreign_keys=[key_digest], lazy='joined', innerjoin=True)
+
+    not_before = db.Column(db.DateTime, nullable=True)
+    not_after = db.Column(db.DateTime, nullable=True)
+    serial = db.Column(db.String(40), nullable=True, index=True)
+    subject_cn = db.Column(db.String(255), nullable=True)
+    fingerprint = db.Column(db.String(64), nullable=True, index=True)
+    subject_key_id = db.Column(db.String(64), nullable=True)
+    authority_key_id = db.Column(db.String(64), nullable=True)
+    is_ca = db.Column(db.Boolean, nullable=True)
+    key_hash = db.Column(db.String(40), nullable=True)
+
+    revoked_at = db.Column(db.DateTime, nullable=True)
+    revocation_reason = db.Column(db.String(32), nullable=True)
+
+    # columns copied from pair as is when archiving
+    COPIED_COLUMNS = ['id', 'identity_id', 'issued_at', 'cert_digest', 'key_digest', 'not_before', 'not_after',
+                      'serial', 'subject_cn', 'fingerprint', 'subject_key_id', 'authority_key_id', 'is_ca',
+                      'key_hash', 'revoked_at', 'revocation_reason']
+
+    def __repr__(self):
+        return '<PairArchive {}>'.format(self.id)
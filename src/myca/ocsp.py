@@ -0,0 +1,134 @@
+import os
+import time
+import base64
+import logging
+import datetime
+import threading
+import urllib.parse
+
+from flask import Blueprint, Response, request
+
+from myca import config, x509, models
+from myca.cache import LRUCache
+
+log = logging.getLogger(__name__)
+
+blueprint = Blueprint('ocsp', __name__)
+
+db = models.db
+Identity = models.Identity
+Pair = models.Pair
+
+cache = LRUCache(config.ocsp_cache_size)
+
+
+class PresignedResponse:
+    def __init__(self, data, this_update, next_update, status, cert_data, ca_pair):
+        self.data = data
+        self.this_update = this_update
+        self.next_update = next_update
+        self.status = status
+        self.cert_data = cert_data
+        self.ca_pair = ca_pair
+
+
+def sign(cert_data, ca_pair, status):
+    this_update = datetime.datetime.utcnow()
+    next_update = this_update + datetime.timedelta(seconds=config.ocsp_validity)
+    revoked_at, revocation_reason = status
+    data = x509.build_ocsp_response(cert_data, ca_pair, this_update, next_update,
+                                    revoked_at=revoked_at, revocation_reason=revocation_reason)
+    return PresignedResponse(data, this_update, next_update, status, cert_data, ca_pair)
+
+
+def get_response(issuer_key_hash, serial):
+    ca_pair = db.session.query(Pair.id, Pair.identity_id).filter(Pair.key_hash == issuer_key_hash).first()
+    if ca_pair is None:
+        return None
+
+    row = db.session.query(Pair.id, Pair.revoked_at, Pair.revocation_reason) \
+        .join(Identity, Pair.identity_id == Identity.id) \
+        .filter(Identity.issuer_id == ca_pair.identity_id, Pair.serial == serial) \
+        .first()
+    if row is None:
+        return None
+
+    key = issuer_key_hash, serial
+    status = row.revoked_at, row.revocation_reason
+
+    response = cache.get(key)
+    if response is None or response.status != status or response.next_update <= datetime.datetime.utcnow():
+        cert_data = db.session.query(models.Blob.data) \
+            .join(Pair, Pair.cert_digest == models.Blob.digest) \
+            .filter(Pair.id == row.id) \
+            .scalar()
+        response = sign(cert_data, Pair.query.get(ca_pair.id).as_tuple, status)
+        cache.set(key, response)
+
+    refresher.ensure_running()
+    return response
+
+
+class Refresher:
+    def __init__(self):
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='ocsp-refresher', daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(config.ocsp_refresh_interval)
+            try:
+                self.refresh()
+            except Exception:
+                log.exception('Failed to refresh OCSP responses')
+
+    def refresh(self):
+        refresh_before = datetime.datetime.utcnow() + datetime.timedelta(seconds=config.ocsp_refresh_margin)
+        for key, response in cache.items():
+            if response.next_update <= refresh_before:
+                cache.replace(key, sign(response.cert_data, response.ca_pair, response.status))
+
+
+refresher = Refresher()
+
+
+def ocsp_response(request_data):
+    try:
+        hash_algorithm, issuer_key_hash, serial = x509.load_ocsp_request(request_data)
+    except (ValueError, NotImplementedError):
+        return Response(x509.build_ocsp_error('MALFORMED_REQUEST'), mimetype='application/ocsp-response')
+
+    response = get_response(issuer_key_hash, serial) if hash_algorithm == 'sha1' else None
+    if response is None:
+        return Response(x509.build_ocsp_error('UNAUTHORIZED'), mimetype='application/ocsp-response')
+
+    # responses carry no nonce, so they can be cached by HTTP caches till nextUpdate
+    http_response = Response(response.data, mimetype='application/ocsp-response')
+    http_response.last_modified = response.this_update
+    http_response.expires = response.next_update
+    http_response.cache_control.public = True
+    http_response.cache_control.no_transform = True
+    http_response.cache_control.must_revalidate = True
+    http_response.cache_control.max_age = max(0, int((response.next_update - datetime.datetime.utcnow())
+                                                     .total_seconds()))
+    return http_response
+
+
+@blueprint.route('/', methods=['POST'], strict_slashes=False)
+def post_view():
+    return ocsp_response(request.get_data())
+
+
+@blueprint.route('/<path:encoded>')
+def get_view(encoded):
+    try:
+        request_data = base64.b64decode(urllib.parse.unquote(encoded))
+    except ValueError:
+        return Response(x509.build_ocsp_error('MALFORMED_REQUEST'), mimetype='application/ocsp-response')
+    return ocsp_response(request_data)
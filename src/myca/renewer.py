@@ -0,0 +1,152 @@
+import time
+import hashlib
+import logging
+import datetime
+import collections
+
+from myca import config, x509, models, signer
+
+log = logging.getLogger(__name__)
+
+db = models.db
+Identity = models.Identity
+Pair = models.Pair
+Job = models.Job
+
+Candidate = collections.namedtuple('Candidate', ['identity_id', 'name', 'pair_id', 'renew_at', 'depth', 'reason'])
+
+REASON_LIFETIME = 'lifetime'
+REASON_ISSUER_RENEWED = 'issuer renewed'
+REASON_STALE_ISSUER_KEY = 'stale issuer key'
+
+
+def get_jitter(pair_id):
+    # stable per pair, so restarts compute the same schedule
+    return int(hashlib.sha256(str(pair_id).encode('ascii')).hexdigest()[:8], 16) / 0xffffffff
+
+
+def get_renew_at(pair_id, not_before, not_after, fraction, jitter):
+    lifetime = not_after - not_before
+    return not_before + lifetime * max(0, fraction - jitter * get_jitter(pair_id))
+
+
+def find_due(now=None, fraction=None, jitter=None, include_roots=False):
+    now = now or datetime.datetime.utcnow()
+    fraction = fraction if fraction is not None else config.renew_fraction
+    jitter = jitter if jitter is not None else config.renew_jitter
+
+    rows = db.session.query(Identity.id, Identity.name, Identity.issuer_id, Identity.current_pair_id,
+                            Pair.not_before, Pair.not_after, Pair.revoked_at,
+                            Pair.subject_key_id, Pair.authority_key_id) \
+        .outerjoin(Pair, Identity.current_pair_id == Pair.id) \
+        .all()
+    by_id = {row.id: row for row in rows}
+    children = collections.defaultdict(list)
+    for row in rows:
+        children[row.issuer_id].append(row)
+    busy = {identity_id for identity_id, in db.session.query(Job.identity_id)
+            .filter(Job.status.in_([Job.STATUS_PENDING, Job.STATUS_RUNNING]))}
+
+    def get_depth(row):
+        depth = 0
+        while row.issuer_id is not None:
+            row = by_id[row.issuer_id]
+            depth += 1
+        return depth
+
+    due = {}
+    for row in rows:
+        if row.current_pair_id is None or row.revoked_at or row.id in busy:
+            continue
+        issuer = by_id[row.issuer_id] if row.issuer_id is not None else None
+        # signed by a key its issuer no longer has, left behind by a failed renewal or a restart after the
+        # issuer was renewed
+        if issuer is not None and issuer.current_pair_id is not None and row.authority_key_id \
+                and issuer.subject_key_id and row.authority_key_id != issuer.subject_key_id:
+            due[row.id] = min(issuer.not_before, now), REASON_STALE_ISSUER_KEY
+            continue
+        if issuer is None and not include_roots:
+            continue
+        renew_at = get_renew_at(row.current_pair_id, row.not_before, row.not_after, fraction, jitter)
+        if renew_at <= now:
+            due[row.id] = renew_at, REASON_LIFETIME
+
+    # a renewed CA gets a new key, so everything it issued has to follow it
+    for identity_id, (renew_at, reason) in list(due.items()):
+        stack = list(children[identity_id])
+        while stack:
+            row = stack.pop()
+            if row.current_pair_id is not None and not row.revoked_at and row.id not in busy:
+                if row.id not in due or renew_at < due[row.id][0]:
+                    due[row.id] = renew_at, REASON_ISSUER_RENEWED
+            stack.extend(children[row.id])
+
+    candidates = [Candidate(identity_id, by_id[identity_id].name, by_id[identity_id].current_pair_id, renew_at,
+                            get_depth(by_id[identity_id]), reason)
+                  for identity_id, (renew_at, reason) in due.items()]
+    # issuers go first, so their children are signed with the renewed issuer pair
+    return sorted(candidates, key=lambda c: (c.depth, c.renew_at))
+
+
+def renew(candidate):
+    identity = Identity.query.get(candidate.identity_id)
+    if identity is None or identity.current_pair_id != candidate.pair_id:
+        return False
+
+    info = x509.load_certificate_info(identity.pair.as_tuple, reissue=True)
+    pair = Pair(*x509.issue_certificate(info, ca_signer=signer.get_for_issuer(identity.issuer)))
+    pair.identity = identity
+    db.session.add(pair)
+    db.session.flush()
+
+    # compare and swap, a concurrent reissue or another renewer instance wins
+    count = Identity.query \
+        .filter(Identity.id == candidate.identity_id, Identity.current_pair_id == candidate.pair_id) \
+        .update({'current_pair_id': pair.id}, synchronize_session=False)
+    if not count:
+        db.session.rollback()
+        return False
+
+    db.session.commit()
+    signer.invalidate(candidate.pair_id)
+    return True
+
+
+class RateLimiter:
+    def __init__(self, per_minute):
+        self.interval = 60 / per_minute if per_minute else 0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
+
+
+def run(fraction=None, jitter=None, rate=None, poll_interval=None, include_roots=False, once=False):
+    rate = rate if rate is not None else config.renew_rate
+    poll_interval = poll_interval or config.renew_poll_interval
+    limiter = RateLimiter(rate)
+
+    log.info('Starting renewer, %s renewals per minute', rate or 'unlimited')
+    while True:
+        candidates = find_due(fraction=fraction, jitter=jitter, include_roots=include_roots)
+        if candidates:
+            log.info('%d identities are due for renewal', len(candidates))
+
+        for candidate in candidates:
+            limiter.wait()
+            try:
+                if renew(candidate):
+                    log.info('Renewed %s', candidate.name)
+                else:
+                    log.info('Skipped %s, it was reissued concurrently', candidate.name)
+            except Exception:
+                db.session.rollback()
+                log.exception('Failed to renew %s', candidate.name)
+
+        db.session.remove()
+        if once:
+            return
+        time.sleep(poll_interval)
@@ -0,0 +1,123 @@
+import time
+import logging
+import datetime
+
+from sqlalchemy import func, or_, and_, exists
+
+from myca import config, models
+
+log = logging.getLogger(__name__)
+
+db = models.db
+Blob = models.Blob
+Pair = models.Pair
+PairArchive = models.PairArchive
+
+
+class Report:
+    def __init__(self):
+        self.archived = 0
+        self.blobs_deleted = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def as_dict(self):
+        return {
+            'archived': self.archived,
+            'blobs_deleted': self.blobs_deleted,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+    def __str__(self):
+        return '{} pairs archived, {} blobs deleted in {:.1f}s'.format(self.archived, self.blobs_deleted, self.elapsed)
+
+
+def query_expired(keep=None, keep_days=None, now=None):
+    # pairs beyond the last `keep` of their identity and older than `keep_days`, either limit may be omitted
+    now = now or datetime.datetime.utcnow()
+
+    ranked = db.session.query(Pair.id, func.row_number().over(partition_by=Pair.identity_id,
+                                                              order_by=(Pair.issued_at.desc(), Pair.id.desc()))
+                              .label('rank')) \
+        .subquery()
+    current_pair_ids = db.session.query(models.Identity.current_pair_id) \
+        .filter(models.Identity.current_pair_id.isnot(None))
+
+    query = db.session.query(Pair.id) \
+        .join(ranked, ranked.c.id == Pair.id) \
+        .filter(~Pair.id.in_(current_pair_ids))
+    # revoked pairs stay until they expire, CRLs and OCSP are served from the pair table
+    query = query.filter(or_(Pair.revoked_at.is_(None), Pair.not_after < now))
+
+    if keep:
+        query = query.filter(ranked.c.rank > keep)
+    if keep_days:
+        query = query.filter(Pair.issued_at < now - datetime.timedelta(days=keep_days))
+    return query
+
+
+def is_orphaned():
+    return and_(*[~exists().where(column == Blob.digest)
+                  for column in (Pair.cert_digest, Pair.key_digest, PairArchive.cert_digest, PairArchive.key_digest)])
+
+
+def delete_orphaned_blobs(batch_size=None, report=None):
+    batch_size = batch_size or config.archive_batch_size
+    report = report or Report()
+
+    while True:
+        digests = [digest for digest, in db.session.query(Blob.digest).filter(is_orphaned()).limit(batch_size)]
+        if not digests:
+            break
+
+        # checked again on delete, the content may have been reused by a pair issued meanwhile
+        report.blobs_deleted += Blob.query.filter(Blob.digest.in_(digests), is_orphaned()) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+
+    return report
+
+
+def archive(keep=None, keep_days=None, batch_size=None, progress=None):
+    keep = keep if keep is not None else config.pair_retention_count
+    keep_days = keep_days if keep_days is not None else config.pair_retention_days
+    batch_size = batch_size or config.archive_batch_size
+    report = Report()
+
+    if not keep and not keep_days:
+        raise ValueError('Retention policy is not configured')
+
+    columns = [getattr(Pair, name) for name in PairArchive.COPIED_COLUMNS]
+    now = datetime.datetime.utcnow()
+    last_id = 0
+
+    while True:
+        pair_ids = [pair_id for pair_id, in query_expired(keep, keep_days, now)
+                    .filter(Pair.id > last_id)
+                    .order_by(Pair.id)
+                    .limit(batch_size)]
+        if not pair_ids:
+            break
+
+        db.session.execute(PairArchive.__table__.insert().from_select(
+            PairArchive.COPIED_COLUMNS + ['archived_at'],
+            db.session.query(*columns, db.literal(now)).filter(Pair.id.in_(pair_ids)).statement))
+        Pair.query.filter(Pair.id.in_(pair_ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+        report.archived += len(pair_ids)
+        last_id = pair_ids[-1]
+        if progress:
+            progress(report)
+
+    # pairs of deleted identities leave their blobs behind
+    delete_orphaned_blobs(batch_size, report)
+    if progress:
+        progress(report)
+
+    report.finished_at = time.monotonic()
+    return report
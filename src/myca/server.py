@@ -0,0 +1,98 @@
+import os
+import logging
+import tempfile
+
+from gunicorn.app.base import BaseApplication
+
+from myca import config, models, keypool, signer, metrics
+
+log = logging.getLogger(__name__)
+
+db = models.db
+Identity = models.Identity
+Pair = models.Pair
+
+
+def parse_key_type(name):
+    if name.startswith('rsa-'):
+        return 'rsa', 65537, int(name[4:])
+    return name, None, None
+
+
+def dispose_engines(app):
+    db.get_engine(app).dispose()
+    for bind in app.config.get('SQLALCHEMY_BINDS') or ():
+        db.get_engine(app, bind=bind).dispose()
+
+
+def warmup(app):
+    # connections inherited from the master must not be shared between workers
+    dispose_engines(app)
+
+    for name in config.warm_key_types:
+        keypool.pool.fill(*parse_key_type(name))
+
+    # a worker that can't reach the database yet still serves, signers are then loaded on first use
+    loaded = 0
+    with app.app_context():
+        try:
+            pairs = Pair.query \
+                .join(Identity, Identity.current_pair_id == Pair.id) \
+                .filter(Pair.is_ca.is_(True), Pair.revoked_at.is_(None)) \
+                .order_by(Pair.issued_at.desc()) \
+                .limit(config.signer_cache_size) \
+                .all()
+            for pair in pairs:
+                try:
+                    signer.get(pair.id, lambda: pair.as_tuple)
+                    loaded += 1
+                except Exception:
+                    log.exception('Failed to load CA signer of pair %s', pair.id)
+        except Exception:
+            log.exception('Failed to preload CA signers')
+        finally:
+            db.session.remove()
+
+    log.info('Worker %s warmed up, %d CA signers loaded', os.getpid(), loaded)
+
+
+def worker_exit(app):
+    dispose_engines(app)
+    metrics.retire()
+
+
+class Application(BaseApplication):
+    def __init__(self, app, options):
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def run(app, bind=None, workers=None, threads=None, max_requests=None, timeout=None, graceful_timeout=None):
+    threads = threads or config.serve_threads
+    options = {
+        'bind': bind or config.serve_bind,
+        'workers': workers or config.serve_workers or os.cpu_count() or 1,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'threads': threads,
+        # the app and plugins are imported once, workers share them copy-on-write
+        'preload_app': True,
+        'max_requests': max_requests if max_requests is not None else config.serve_max_requests,
+        'max_requests_jitter': config.serve_max_requests_jitter,
+        'timeout': timeout if timeout is not None else config.serve_timeout,
+        'graceful_timeout': graceful_timeout if graceful_timeout is not None else config.serve_graceful_timeout,
+        'accesslog': '-',
+        'post_fork': lambda server, worker: warmup(app),
+        'worker_exit': lambda server, worker: worker_exit(app),
+    }
+    if config.metrics_enabled:
+        # any worker may answer a scrape, it reports the sum of all of them
+        metrics.share(config.metrics_dir or tempfile.mkdtemp(prefix='myca-metrics-'))
+    Application(app, options).run()
@@ -0,0 +1,49 @@
+from sqlalchemy import inspect
+
+from myca import config, x509
+from myca.cache import LRUCache
+
+# pair rows are immutable, so signers keyed by pair id never go stale, reissued or reverted CAs
+# simply switch to another key and old entries are dropped explicitly or age out
+cache = LRUCache(config.signer_cache_size)
+
+
+def get(ca_pair_id, load_pair):
+    return cache.get_or_create(ca_pair_id, lambda: x509.CaSigner(load_pair()))
+
+
+def get_for_issuer(issuer):
+    if issuer is None:
+        return None
+
+    # a pair assigned in this session is not reflected in current_pair_id until flush
+    if 'current_pair' in inspect(issuer).unloaded:
+        pair_id = issuer.current_pair_id
+    else:
+        pair_id = issuer.current_pair.id if issuer.current_pair else None
+
+    if pair_id is None:
+        return x509.CaSigner(issuer.pair.as_tuple)
+    return get(pair_id, lambda: issuer.pair.as_tuple)
+
+
+def invalidate(ca_pair_id):
+    cache.invalidate(ca_pair_id)
+
+
+def load_pair(ca_pair_id):
+    from myca import models
+    return models.Pair.query.get(ca_pair_id).as_tuple
+
+
+def sign_many(ca_pair_id, infos, load=None):
+    # one failed certificate does not fail the batch, its exception takes the place of the result
+    ca_signer = get(ca_pair_id, load or (lambda: load_pair(ca_pair_id))) if ca_pair_id is not None else None
+
+    results = []
+    for info in infos:
+        try:
+            results.append(x509.issue_certificate(info, ca_signer=ca_signer))
+        except Exception as e:
+            results.append(e)
+    return results
@@ -0,0 +1,149 @@
+import os
+import time
+import logging
+import collections
+import concurrent.futures
+
+from myca import config, x509, models
+
+log = logging.getLogger(__name__)
+
+db = models.db
+
+NOT_ISSUED = 'Certificate is not issued'
+REVOKED = 'Certificate is revoked'
+ISSUER_INVALID = 'Issuer certificate is invalid'
+
+
+class Report:
+    def __init__(self, total=0):
+        self.total = total
+        self.valid = 0
+        self.invalid = []
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def add(self, node, error=None):
+        if error is None:
+            self.valid += 1
+        else:
+            self.invalid.append({
+                'id': node.id,
+                'name': node.name,
+                'issuer_id': node.issuer_id,
+                'error': error,
+            })
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'valid': self.valid,
+            'invalid': self.invalid,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+    def __str__(self):
+        return '{} verified: {} valid, {} invalid in {:.1f}s'.format(
+            self.total, self.valid, len(self.invalid), self.elapsed)
+
+
+def verify_many(cert_chain, items):
+    store = x509.create_certificate_store(cert_chain)
+    results = []
+    for identity_id, cert_data in items:
+        try:
+            x509.verify_certificate(cert_data, store)
+        except x509.InvalidCertificate as e:
+            results.append((identity_id, str(e)))
+        else:
+            results.append((identity_id, None))
+    return results
+
+
+def load_nodes():
+    return db.session.query(models.Identity.id, models.Identity.name, models.Identity.issuer_id,
+                            models.Blob.data.label('cert'), models.Pair.revoked_at) \
+        .outerjoin(models.Pair, models.Identity.current_pair_id == models.Pair.id) \
+        .outerjoin(models.Blob, models.Pair.cert_digest == models.Blob.digest) \
+        .all()
+
+
+def verify_all(concurrency=None, batch_size=None):
+    concurrency = concurrency or os.cpu_count()
+    batch_size = batch_size or config.verify_batch_size
+
+    nodes = load_nodes()
+    report = Report(len(nodes))
+
+    children = collections.defaultdict(list)
+    for node in nodes:
+        children[node.issuer_id].append(node)
+
+    # issuers are verified here once each, leaves are grouped by their issuer chain for the pool
+    leaves = collections.defaultdict(list)
+    stores = {}
+    stack = [(node, None) for node in children[None]]
+    while stack:
+        node, cert_chain = stack.pop()
+
+        if node.cert is None:
+            error = NOT_ISSUED
+        elif node.revoked_at:
+            error = REVOKED
+        else:
+            error = None
+
+        if node.id not in children:
+            if error:
+                report.add(node, error)
+            else:
+                leaves[cert_chain or (node.cert,)].append((node.id, node.cert))
+            continue
+
+        if error is None:
+            store_chain = cert_chain or (node.cert,)
+            try:
+                if store_chain not in stores:
+                    stores[store_chain] = x509.create_certificate_store(store_chain)
+                x509.verify_certificate(node.cert, stores[store_chain])
+            except x509.InvalidCertificate as e:
+                error = str(e)
+        report.add(node, error)
+
+        if error is None:
+            child_chain = (node.cert,) + (cert_chain or ())
+            stack.extend((child, child_chain) for child in children[node.id])
+        else:
+            mark_subtree_invalid(node, children, report)
+
+    by_id = {node.id: node for node in nodes}
+    with concurrent.futures.ProcessPoolExecutor(concurrency) as executor:
+        futures = {}
+        for cert_chain, items in leaves.items():
+            for i in range(0, len(items), batch_size):
+                batch = items[i:i + batch_size]
+                futures[executor.submit(verify_many, cert_chain, batch)] = batch
+
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                results = future.result()
+            except Exception as e:
+                log.exception('Failed to verify batch')
+                results = [(identity_id, str(e) or e.__class__.__name__) for identity_id, _ in futures[future]]
+            for identity_id, error in results:
+                report.add(by_id[identity_id], error)
+
+    report.finished_at = time.monotonic()
+    return report
+
+
+def mark_subtree_invalid(issuer, children, report):
+    stack = list(children[issuer.id])
+    while stack:
+        node = stack.pop()
+        report.add(node, '{}: {}'.format(ISSUER_INVALID, issuer.name))
+        stack.extend(children.get(node.id, ()))
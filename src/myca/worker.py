@@ -0,0 +1,173 @@
+import os
+import math
+import time
+import logging
+import datetime
+import concurrent.futures
+
+from sqlalchemy import or_
+
+from myca import config, keypool, x509, models, signer
+
+log = logging.getLogger(__name__)
+
+Job = models.Job
+ACTIVE_STATUSES = [Job.STATUS_PENDING, Job.STATUS_RUNNING]
+
+
+class Postponed(Exception):
+    pass
+
+
+def sign_batch(infos, ca_pair_id=None, ca_pair=None):
+    # pool processes generate keys themselves, filler threads would only compete with them for CPU
+    keypool.pool.size = 0
+    # pool processes have no database session, the pair is sent along and only parsed on a signer cache miss
+    return signer.sign_many(ca_pair_id, infos, lambda: ca_pair)
+
+
+def submit_batches(executor, tasks, concurrency):
+    # tasks are grouped by CA, so every batch carries the CA pair once
+    by_ca = {}
+    ca_pairs = {}
+    for item, info, ca_pair_id, ca_pair in tasks:
+        by_ca.setdefault(ca_pair_id, []).append((item, info))
+        ca_pairs[ca_pair_id] = ca_pair
+
+    futures = {}
+    for ca_pair_id, group in by_ca.items():
+        ca_pair = ca_pairs[ca_pair_id]
+        batch_size = math.ceil(len(group) / concurrency)
+        for i in range(0, len(group), batch_size):
+            batch = group[i:i + batch_size]
+            future = executor.submit(sign_batch, [info for item, info in batch], ca_pair_id, ca_pair)
+            futures[future] = [item for item, info in batch]
+    return futures
+
+
+def iter_results(futures):
+    for future in concurrent.futures.as_completed(futures):
+        items = futures[future]
+        try:
+            results = future.result()
+        except Exception as e:
+            results = [e] * len(items)
+        yield from zip(items, results)
+
+
+def run(concurrency=None, poll_interval=None, burst=False):
+    concurrency = concurrency or config.worker_concurrency or os.cpu_count()
+    poll_interval = poll_interval or config.worker_poll_interval
+
+    log.info('Starting worker with %d processes', concurrency)
+    with concurrent.futures.ProcessPoolExecutor(concurrency) as executor:
+        while True:
+            requeue_stale_jobs()
+            jobs = claim_jobs(concurrency * 2)
+
+            # postponed jobs are back in the queue, claiming them again right away would spin
+            if jobs and run_jobs(executor, jobs, concurrency):
+                continue
+            if burst:
+                return
+            time.sleep(poll_interval)
+
+
+def requeue_stale_jobs():
+    stale_since = datetime.datetime.utcnow() - datetime.timedelta(seconds=config.worker_job_timeout)
+    count = Job.query \
+        .filter(Job.status == Job.STATUS_RUNNING, Job.started_at < stale_since) \
+        .update({'status': Job.STATUS_PENDING, 'started_at': None}, synchronize_session=False)
+    models.db.session.commit()
+    if count:
+        log.warning('Requeued %d stale jobs', count)
+
+
+def claim_jobs(limit):
+    session = models.db.session
+    active_identities = session.query(Job.identity_id).filter(Job.status.in_(ACTIVE_STATUSES))
+    candidates = session.query(Job.id) \
+        .join(models.Identity, Job.identity_id == models.Identity.id) \
+        .filter(Job.status == Job.STATUS_PENDING) \
+        .filter(or_(models.Identity.issuer_id.is_(None), ~models.Identity.issuer_id.in_(active_identities))) \
+        .order_by(Job.id) \
+        .limit(limit) \
+        .all()
+
+    claimed = []
+    for job_id, in candidates:
+        count = Job.query \
+            .filter(Job.id == job_id, Job.status == Job.STATUS_PENDING) \
+            .update({'status': Job.STATUS_RUNNING, 'started_at': datetime.datetime.utcnow()},
+                    synchronize_session=False)
+        if count:
+            claimed.append(job_id)
+    session.commit()
+
+    if not claimed:
+        return []
+    return Job.query.filter(Job.id.in_(claimed)).order_by(Job.id).all()
+
+
+def prepare_job(job):
+    identity = job.identity
+
+    if identity.issuer:
+        # children must be signed with the new issuer pair when the issuer itself is being (re)issued
+        if identity.issuer.jobs.filter(Job.status.in_(ACTIVE_STATUSES)).count():
+            raise Postponed()
+        issuer_pair = identity.issuer.pair
+        if issuer_pair is None:
+            raise ValueError('Issuer has no certificate')
+        ca_pair_id, ca_pair = issuer_pair.id, issuer_pair.as_tuple
+    else:
+        ca_pair_id, ca_pair = None, None
+
+    if job.kind == Job.KIND_REISSUE:
+        info = x509.load_certificate_info(identity.pair.as_tuple, reissue=True)
+    else:
+        info = x509.CertInfo.from_json(job.data)
+
+    return info, ca_pair_id, ca_pair
+
+
+def run_jobs(executor, jobs, concurrency):
+    session = models.db.session
+    tasks = []
+    postponed = 0
+
+    for job in jobs:
+        try:
+            info, ca_pair_id, ca_pair = prepare_job(job)
+        except Postponed:
+            job.status = Job.STATUS_PENDING
+            job.started_at = None
+            postponed += 1
+        except Exception as e:
+            log.exception('Failed to prepare job %s', job.id)
+            finish_job(job, e)
+        else:
+            tasks.append((job, info, ca_pair_id, ca_pair))
+    session.commit()
+
+    for job, result in iter_results(submit_batches(executor, tasks, concurrency)):
+        if isinstance(result, Exception):
+            log.error('Job %s failed: %r', job.id, result)
+            finish_job(job, result)
+        else:
+            cert, key = result
+            job.identity.pair = models.Pair(cert, key)
+            finish_job(job)
+        session.commit()
+
+    return len(jobs) - postponed
+
+
+def finish_job(job, error=None):
+    job.finished_at = datetime.datetime.utcnow()
+    if error is None:
+        job.status = Job.STATUS_DONE
+        job.error = None
+    else:
+        job.status = Job.STATUS_FAILED
+        job.error = str(error) or error.__class__.__name__
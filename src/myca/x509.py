@@ -1,19 +1,37 @@
+import re
 import copy
+import base64
 import datetime
+import hashlib
 import ipaddress
 import subprocess
 
 from OpenSSL import crypto
 from cryptography import x509
+from cryptography.x509 import ocsp
 from cryptography.x509.oid import NameOID, ExtensionOID, ExtendedKeyUsageOID
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
+
+from myca import config, keypool, certtext
+from myca.cache import LRUCache
+
+cache = LRUCache(config.x509_cache_size)
+
+PEM_RE = re.compile(rb'-----BEGIN ([A-Z0-9 ]+)-----(.*?)-----END \1-----', re.S)
+
+REVOCATION_REASONS = [reason.name for reason in x509.ReasonFlags if reason != x509.ReasonFlags.remove_from_crl]
+
+
+CERT_INFO_DATETIMES = ('cert_validate_since', 'cert_validate_till')
+JSON_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
 
 
 class CertInfo:
     def __init__(self, data=None):
+        self.key_type = None
         self.key_size = None
         self.key_public_exponent = None
         self.subj_cn = None
@@ -39,10 +57,63 @@ class CertInfo:
     def as_dict(self):
         return copy.copy(self.__dict__)
 
-
-def issue_certificate(data, ca_pair=None):
-    key = rsa.generate_private_key(public_exponent=data.key_public_exponent, key_size=data.key_size,
-                                   backend=default_backend())
+    def as_json(self):
+        data = self.as_dict()
+        data.pop('issuer', None)
+        for name in CERT_INFO_DATETIMES:
+            if data.get(name):
+                data[name] = data[name].strftime(JSON_DATETIME_FORMAT)
+        return data
+
+    @classmethod
+    def from_json(cls, data):
+        data = dict(data)
+        for name in CERT_INFO_DATETIMES:
+            if data.get(name):
+                data[name] = datetime.datetime.strptime(data[name], JSON_DATETIME_FORMAT)
+        return cls(data)
+
+
+def get_key_params(data):
+    # jobs queued before key types were introduced have no key_type
+    key_type = getattr(data, 'key_type', None) or 'rsa'
+    if key_type == 'rsa':
+        return key_type, data.key_public_exponent or 65537, data.key_size or 2048
+    return key_type, None, None
+
+
+def get_key_type(key):
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return 'rsa'
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        for key_type, curve in keypool.CURVES.items():
+            if key.curve.name == curve.name:
+                return key_type
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return 'ed25519'
+    raise ValueError('Unsupported key type')
+
+
+def get_signature_hash(key):
+    # Ed25519 signatures are computed over the whole message and take no digest
+    if isinstance(key, ed25519.Ed25519PrivateKey):
+        return None
+    return hashes.SHA256()
+
+
+class CaSigner:
+    def __init__(self, ca_pair):
+        ca_cert = load_certificate(ca_pair[0])
+        self.key = load_private_key(ca_pair[1])
+        self.subject = ca_cert.subject
+        self.authority_key_id = x509.AuthorityKeyIdentifier(
+            x509.SubjectKeyIdentifier.from_public_key(self.key.public_key()).digest,
+            [x509.DirectoryName(ca_cert.subject)],
+            ca_cert.serial_number)
+
+
+def issue_certificate(data, ca_pair=None, ca_signer=None):
+    key = keypool.pool.generate_private_key(*get_key_params(data))
     key_id = x509.SubjectKeyIdentifier.from_public_key(key.public_key())
 
     subj_name_attrs = [x509.NameAttribute(NameOID.COMMON_NAME, data.subj_cn)]
@@ -83,63 +154,204 @@ def issue_certificate(data, ca_pair=None):
     if sans:
         cert = cert.add_extension(x509.SubjectAlternativeName(sans), critical=False)
 
-    if ca_pair:
-        ca_cert, ca_key = ca_pair
-        ca_cert = x509.load_pem_x509_certificate(ca_cert, default_backend())
-        ca_key = serialization.load_pem_private_key(ca_key, password=None, backend=default_backend())
-        ca_key_id = x509.SubjectKeyIdentifier.from_public_key(ca_key.public_key())
-        ca_subject = ca_cert.subject
-        ca_sn = ca_cert.serial_number
+    if ca_pair and ca_signer is None:
+        ca_signer = CaSigner(ca_pair)
+
+    if ca_signer:
+        ca_key = ca_signer.key
+        ca_subject = ca_signer.subject
+        authority_key_id = ca_signer.authority_key_id
     else:
         cert = cert.add_extension(x509.BasicConstraints(ca=True, path_length=0), critical=True)
-        ca_cert = cert
         ca_key = key
-        ca_key_id = key_id
         ca_subject = subject
-        ca_sn = sn
+        authority_key_id = x509.AuthorityKeyIdentifier(key_id.digest, [x509.DirectoryName(subject)], sn)
 
     cert = cert \
         .issuer_name(ca_subject) \
-        .add_extension(x509.AuthorityKeyIdentifier(ca_key_id.digest,
-                                                   [x509.DirectoryName(ca_subject)],
-                                                   ca_sn),
-                       critical=False) \
+        .add_extension(authority_key_id, critical=False) \
         .add_extension(x509.KeyUsage(digital_signature=True,
                                      content_commitment=False,
-                                     key_encipherment=bool(ca_pair),
+                                     key_encipherment=bool(ca_signer) and isinstance(key, rsa.RSAPrivateKey),
                                      data_encipherment=False,
                                      key_agreement=False,
-                                     key_cert_sign=not bool(ca_pair),
-                                     crl_sign=not bool(ca_pair),
+                                     key_cert_sign=not bool(ca_signer),
+                                     crl_sign=not bool(ca_signer),
                                      encipher_only=False,
                                      decipher_only=False),
                        critical=True) \
-        .sign(ca_key, hashes.SHA256(), default_backend())
+        .sign(ca_key, get_signature_hash(ca_key), default_backend())
 
-    cert = cert.public_bytes(serialization.Encoding.PEM)
-    key = key.private_bytes(encoding=serialization.Encoding.PEM,
-                            format=serialization.PrivateFormat.TraditionalOpenSSL,
+    cert = cert.public_bytes(serialization.Encoding.DER)
+    key = key.private_bytes(encoding=serialization.Encoding.DER,
+                            format=serialization.PrivateFormat.PKCS8 if isinstance(key, ed25519.Ed25519PrivateKey)
+                            else serialization.PrivateFormat.TraditionalOpenSSL,
                             encryption_algorithm=serialization.NoEncryption())
     return cert, key
 
 
+def build_crl(ca_pair, revoked, number, this_update, next_update, delta_base=None):
+    ca_cert = load_certificate(ca_pair[0])
+    ca_key = load_private_key(ca_pair[1])
+
+    revoked_certificates = []
+    for serial, revoked_at, reason in revoked:
+        builder = x509.RevokedCertificateBuilder() \
+            .serial_number(int(serial, 16)) \
+            .revocation_date(revoked_at)
+        if reason and reason != x509.ReasonFlags.unspecified.name:
+            builder = builder.add_extension(x509.CRLReason(x509.ReasonFlags[reason]), critical=False)
+        revoked_certificates.append(builder.build(default_backend()))
+
+    extensions = [
+        x509.Extension(ExtensionOID.CRL_NUMBER, False, x509.CRLNumber(number)),
+        x509.Extension(ExtensionOID.AUTHORITY_KEY_IDENTIFIER, False,
+                       x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_key.public_key())),
+    ]
+    if delta_base is not None:
+        extensions.append(x509.Extension(ExtensionOID.DELTA_CRL_INDICATOR, True, x509.DeltaCRLIndicator(delta_base)))
+
+    # passing all entries to the constructor avoids copying the entry list on every add_revoked_certificate()
+    builder = x509.CertificateRevocationListBuilder(issuer_name=ca_cert.subject,
+                                                    last_update=this_update,
+                                                    next_update=next_update,
+                                                    extensions=extensions,
+                                                    revoked_certificates=revoked_certificates)
+    crl = builder.sign(ca_key, get_signature_hash(ca_key), default_backend())
+    return crl.public_bytes(serialization.Encoding.DER)
+
+
+def load_ocsp_request(request_data):
+    request = ocsp.load_der_ocsp_request(request_data)
+    return request.hash_algorithm.name, request.issuer_key_hash.hex(), format_serial(request.serial_number)
+
+
+def build_ocsp_response(cert_data, ca_pair, this_update, next_update, revoked_at=None, revocation_reason=None):
+    ca_cert = load_certificate(ca_pair[0])
+    ca_key = load_private_key(ca_pair[1])
+
+    if revoked_at:
+        status = ocsp.OCSPCertStatus.REVOKED
+        reason = x509.ReasonFlags[revocation_reason] if revocation_reason else None
+    else:
+        status = ocsp.OCSPCertStatus.GOOD
+        reason = None
+
+    response = ocsp.OCSPResponseBuilder() \
+        .add_response(cert=load_certificate(cert_data), issuer=ca_cert, algorithm=hashes.SHA1(),
+                      cert_status=status, this_update=this_update, next_update=next_update,
+                      revocation_time=revoked_at, revocation_reason=reason) \
+        .responder_id(ocsp.OCSPResponderEncoding.HASH, ca_cert) \
+        .sign(ca_key, get_signature_hash(ca_key))
+    return response.public_bytes(serialization.Encoding.DER)
+
+
+def build_ocsp_error(status_name):
+    response = ocsp.OCSPResponseBuilder.build_unsuccessful(ocsp.OCSPResponseStatus[status_name])
+    return response.public_bytes(serialization.Encoding.DER)
+
+
+def crl_to_pem(crl_data):
+    crl = x509.load_der_x509_crl(crl_data, default_backend())
+    return crl.public_bytes(serialization.Encoding.PEM)
+
+
 def get_certificate_text(cert_data):
+    if config.cert_text_openssl:
+        return _cached('openssl_text', cert_data, lambda: get_openssl_certificate_text(cert_data))
+    return _cached('text', cert_data, lambda: certtext.render(load_certificate(cert_data)))
+
+
+def get_openssl_certificate_text(cert_data):
     return subprocess.run(['openssl', 'x509',
                            '-in', '/dev/stdin',
                            '-text'],
                           check=True,
                           stdout=subprocess.PIPE,
-                          input=cert_data).stdout.decode('ascii')
+                          input=cert_to_pem(cert_data)).stdout.decode('ascii')
+
+
+def _cached(kind, data, factory):
+    return cache.get_or_create((kind, hashlib.sha256(data).digest()), factory)
+
+
+def load_certificate(cert_data):
+    load = x509.load_pem_x509_certificate if is_pem(cert_data) else x509.load_der_x509_certificate
+    return _cached('cert', cert_data, lambda: load(cert_data, default_backend()))
+
+
+def load_private_key(key_data):
+    load = serialization.load_pem_private_key if is_pem(key_data) else serialization.load_der_private_key
+    return _cached('key', key_data, lambda: load(key_data, password=None, backend=default_backend()))
+
+
+def _load_openssl_certificate(cert_data):
+    filetype = crypto.FILETYPE_PEM if is_pem(cert_data) else crypto.FILETYPE_ASN1
+    return _cached('openssl_cert', cert_data, lambda: crypto.load_certificate(filetype, cert_data))
+
+
+def is_pem(data):
+    return data.lstrip().startswith(b'-----BEGIN ')
+
+
+def to_der(data):
+    if not is_pem(data):
+        return data
+
+    match = PEM_RE.search(data)
+    if match is None:
+        raise ValueError('Broken PEM data')
+    return base64.b64decode(match.group(2))
+
+
+def to_pem(label, der_data):
+    data = base64.b64encode(der_data)
+    lines = [b'-----BEGIN ' + label + b'-----']
+    lines += [data[i:i + 64] for i in range(0, len(data), 64)]
+    lines.append(b'-----END ' + label + b'-----')
+    return b'\n'.join(lines) + b'\n'
+
+
+def cert_to_pem(cert_data):
+    return cert_data if is_pem(cert_data) else to_pem(b'CERTIFICATE', cert_data)
+
+
+def key_to_pem(key_data):
+    return key_data if is_pem(key_data) else to_pem(get_private_key_label(key_data), key_data)
+
+
+def get_private_key_label(key_data):
+    # PKCS#8, PKCS#1 and SEC1 keys are all a SEQUENCE starting with a version INTEGER,
+    # they differ in the type of the element that follows it
+    try:
+        offset = 2 + (key_data[1] & 0x7f if key_data[1] & 0x80 else 0)
+        offset += 2 + key_data[offset + 1]
+        return {0x30: b'PRIVATE KEY', 0x02: b'RSA PRIVATE KEY', 0x04: b'EC PRIVATE KEY'}[key_data[offset]]
+    except (IndexError, KeyError):
+        raise ValueError('Broken private key') from None
 
 
 def load_certificate_info(pair, reissue=False):
-    cert = x509.load_pem_x509_certificate(pair[0], default_backend())
-    key = serialization.load_pem_private_key(pair[1], password=None, backend=default_backend())
-    public_key = key.public_key()
+    info = _cached('info', pair[0] + pair[1], lambda: _load_certificate_info(pair))
+    info = copy.deepcopy(info)
+
+    if reissue:
+        valid_period = info.cert_validate_till - info.cert_validate_since
+        info.cert_validate_since = datetime.datetime.utcnow()
+        info.cert_validate_till = info.cert_validate_since + valid_period
+
+    return info
+
+
+def _load_certificate_info(pair):
+    cert = load_certificate(pair[0])
+    key = load_private_key(pair[1])
 
     info = CertInfo()
-    info.key_size = key.key_size
-    info.key_public_exponent = public_key.public_numbers().e
+    info.key_type = get_key_type(key)
+    if info.key_type == 'rsa':
+        info.key_size = key.key_size
+        info.key_public_exponent = key.public_key().public_numbers().e
 
     v = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
     if v:
@@ -172,11 +384,6 @@ def load_certificate_info(pair, reissue=False):
     info.cert_validate_since = cert.not_valid_before
     info.cert_validate_till = cert.not_valid_after
 
-    if reissue:
-        valid_period = info.cert_validate_till - info.cert_validate_since
-        info.cert_validate_since = datetime.datetime.utcnow()
-        info.cert_validate_till = info.cert_validate_since + valid_period
-
     try:
         ext_key_usage = cert.extensions.get_extension_for_oid(ExtensionOID.EXTENDED_KEY_USAGE).value
     except x509.extensions.ExtensionNotFound:
@@ -196,15 +403,76 @@ def load_certificate_info(pair, reissue=False):
     return info
 
 
+def get_certificate_metadata(cert_data):
+    cert = load_certificate(cert_data)
+
+    v = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+    subject_cn = v[0].value if v else None
+
+    try:
+        subject_key_id = cert.extensions.get_extension_for_oid(ExtensionOID.SUBJECT_KEY_IDENTIFIER).value.digest.hex()
+    except x509.extensions.ExtensionNotFound:
+        subject_key_id = None
+
+    try:
+        authority_key_id = cert.extensions.get_extension_for_oid(ExtensionOID.AUTHORITY_KEY_IDENTIFIER).value
+    except x509.extensions.ExtensionNotFound:
+        authority_key_id = None
+    else:
+        authority_key_id = authority_key_id.key_identifier.hex() if authority_key_id.key_identifier else None
+
+    try:
+        is_ca = cert.extensions.get_extension_for_oid(ExtensionOID.BASIC_CONSTRAINTS).value.ca
+    except x509.extensions.ExtensionNotFound:
+        is_ca = False
+
+    key_hash = x509.SubjectKeyIdentifier.from_public_key(cert.public_key()).digest.hex()
+
+    return {
+        'not_before': cert.not_valid_before,
+        'not_after': cert.not_valid_after,
+        'serial': format_serial(cert.serial_number),
+        'subject_cn': subject_cn,
+        'fingerprint': cert.fingerprint(hashes.SHA256()).hex(),
+        'subject_key_id': subject_key_id,
+        'authority_key_id': authority_key_id,
+        'is_ca': is_ca,
+        'key_hash': key_hash,
+    }
+
+
+def get_public_key_id(cert_data=None, key_data=None):
+    if cert_data is not None:
+        public_key = load_certificate(cert_data).public_key()
+    else:
+        public_key = load_private_key(key_data).public_key()
+    return hashlib.sha256(public_key.public_bytes(serialization.Encoding.DER,
+                                                  serialization.PublicFormat.SubjectPublicKeyInfo)).hexdigest()
+
+
+def format_serial(serial_number):
+    return '{:x}'.format(serial_number)
+
+
 def verify_certificate_chain(cert_data, ca_cert_chain_data=()):
+    verify_certificate(cert_data, create_certificate_store(ca_cert_chain_data))
+
+
+def create_certificate_store(ca_cert_chain_data=()):
     try:
         store = crypto.X509Store()
 
         for ca_cert_data in ca_cert_chain_data:
-            ca_cert = crypto.load_certificate(crypto.FILETYPE_PEM, ca_cert_data)
-            store.add_cert(ca_cert)
+            store.add_cert(_load_openssl_certificate(ca_cert_data))
+    except crypto.Error as e:
+        raise InvalidCertificate('Broken certificate') from e
+
+    return store
 
-        cert = crypto.load_certificate(crypto.FILETYPE_PEM, cert_data)
+
+def verify_certificate(cert_data, store):
+    try:
+        cert = _load_openssl_certificate(cert_data)
         store_ctx = crypto.X509StoreContext(store, cert)
         store_ctx.verify_certificate()
     except crypto.Error as e:
@@ -214,8 +482,8 @@ def verify_certificate_chain(cert_data, ca_cert_chain_data=()):
 
 
 def does_keys_match(pair):
-    cert = x509.load_pem_x509_certificate(pair[0], default_backend())
-    key = serialization.load_pem_private_key(pair[1], password=None, backend=default_backend())
+    cert = load_certificate(pair[0])
+    key = load_private_key(pair[1])
     key1 = cert.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
     key2 = key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
     return key1 == key2
@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'tools')]
+
+# myca.config reads the environment on import
+os.environ['DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'myca.db')
+os.environ.pop('DATABASE_REPLICA_URI', None)
+os.environ['ASYNC_ISSUANCE'] = '0'
+os.environ['K8S_SYNC_ON_COMMIT'] = '0'
+
+
+@pytest.fixture
+def app():
+    from myca.app import app
+    from myca import models
+
+    with app.app_context():
+        models.db.create_all()
+        yield app
+        models.db.session.remove()
+        models.db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,167 @@
+import json
+
+import pytest
+
+from fake_k8s_api import FakeApiServer
+from myca import models, k8s
+
+
+@pytest.fixture
+def k8s_api():
+    server = FakeApiServer(token='token')
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def k8s_client(k8s_api, tmpdir):
+    token_file = tmpdir.join('token')
+    token_file.write('token\n')
+    return k8s.Client(k8s_api.url, token_file=str(token_file))
+
+
+def post_json(client, url, data=None):
+    response = client.post(url, data=json.dumps(data), content_type='application/json')
+    return response.status_code, json.loads(response.data.decode('utf-8'))
+
+
+def create_identity(client, name, secret=None, issuer_id=None):
+    status, data = post_json(client, '/api/identities', {'subj_cn': name, 'key_type': 'ed25519',
+                                                         'issuer_id': issuer_id, 'k8s_secret': secret})
+    assert status == 201, data
+    return data['id']
+
+
+def reissue(client, identity_id):
+    status, data = post_json(client, '/api/identities/{}/reissue'.format(identity_id))
+    assert status == 201, data
+
+
+def get_identity(identity_id):
+    models.db.session.remove()
+    return models.Identity.query.get(identity_id)
+
+
+def test_create_then_merge_patch(client, k8s_api, k8s_client):
+    ca_id = create_identity(client, 'ca')
+    leaf_id = create_identity(client, 'leaf', 'apps/leaf-tls', ca_id)
+
+    report = k8s.sync(k8s_client)
+    assert report.synced == 1 and not report.failed
+    assert k8s_api.requests == [('PATCH', '/api/v1/namespaces/apps/secrets/leaf-tls'),
+                                ('POST', '/api/v1/namespaces/apps/secrets')]
+
+    leaf = get_identity(leaf_id)
+    secret = k8s_api.secrets['apps', 'leaf-tls']
+    assert secret['type'] == 'kubernetes.io/tls'
+    assert secret['metadata']['annotations']['myca/pair-id'] == str(leaf.current_pair_id)
+    assert k8s_api.get_secret('apps', 'leaf-tls')['tls.crt'].startswith(b'-----BEGIN CERTIFICATE-----')
+    uid = secret['metadata']['uid']
+
+    # changes made by others survive the update
+    secret['metadata']['labels']['team'] = 'web'
+    secret['data']['extra'] = 'eA=='
+
+    reissue(client, leaf_id)
+    del k8s_api.requests[:]
+    assert k8s.sync(k8s_client).synced == 1
+    assert k8s_api.requests == [('PATCH', '/api/v1/namespaces/apps/secrets/leaf-tls')]
+
+    leaf = get_identity(leaf_id)
+    secret = k8s_api.secrets['apps', 'leaf-tls']
+    assert secret['metadata']['uid'] == uid
+    assert secret['metadata']['annotations']['myca/pair-id'] == str(leaf.current_pair_id)
+    assert secret['metadata']['labels'] == {'myca/identity-id': str(leaf_id), 'team': 'web'}
+    assert k8s_api.get_secret('apps', 'leaf-tls')['tls.crt'] == leaf.pair.cert_str.encode('ascii')
+    assert 'extra' in secret['data']
+
+
+def test_synced_pair_id(client, k8s_api, k8s_client):
+    ca_id = create_identity(client, 'ca', 'ca-tls')
+    leaf_id = create_identity(client, 'leaf', 'leaf-tls', ca_id)
+    plain_id = create_identity(client, 'plain', issuer_id=ca_id)
+    assert get_identity(leaf_id).synced_pair_id is None
+
+    k8s.sync(k8s_client)
+    for identity_id in (ca_id, leaf_id):
+        identity = get_identity(identity_id)
+        assert identity.synced_pair_id == identity.current_pair_id
+    assert get_identity(plain_id).synced_pair_id is None
+    assert sorted(k8s_api.secrets) == [('default', 'ca-tls'), ('default', 'leaf-tls')]
+
+    reissue(client, leaf_id)
+    assert [identity.id for identity in k8s.query_pending()] == [leaf_id]
+
+    # a different Secret has to be written even if the pair is the same
+    leaf = get_identity(leaf_id)
+    leaf.k8s_secret = 'other/leaf-tls'
+    models.db.session.commit()
+    assert get_identity(leaf_id).synced_pair_id is None
+
+
+def test_no_push_when_unchanged(client, k8s_api, k8s_client):
+    create_identity(client, 'ca', 'ca-tls')
+    assert k8s.sync(k8s_client).synced == 1
+
+    del k8s_api.requests[:]
+    report = k8s.sync(k8s_client)
+    assert report.synced == 0 and not report.failed
+    assert k8s_api.requests == []
+
+
+@pytest.mark.parametrize('status', [503, 429])
+def test_retryable_error_stops_sync(client, k8s_api, k8s_client, status):
+    ca_id = create_identity(client, 'ca', 'ca-tls')
+    leaf_id = create_identity(client, 'leaf', 'leaf-tls', ca_id)
+
+    k8s_api.fail_next(1, status)
+    with pytest.raises(k8s.ApiError) as e:
+        k8s.sync(k8s_client)
+    assert e.value.status == status and e.value.retryable
+    assert len(k8s_api.requests) == 1
+    assert [identity.id for identity in k8s.query_pending()] == [ca_id, leaf_id]
+
+    assert k8s.sync(k8s_client).synced == 2
+    assert k8s.query_pending().count() == 0
+
+
+def test_rejected_secret_is_skipped(client, k8s_api, k8s_client):
+    ca_id = create_identity(client, 'ca', 'ca-tls')
+    leaf_id = create_identity(client, 'leaf', 'leaf-tls', ca_id)
+
+    k8s_api.fail_next(1, 422)
+    report = k8s.sync(k8s_client)
+    assert report.synced == 1
+    assert [item['id'] for item in report.failed] == [ca_id]
+    assert get_identity(leaf_id).synced_pair_id is not None
+    assert [identity.id for identity in k8s.query_pending()] == [ca_id]
+
+
+def test_backoff():
+    backoff = k8s.Backoff(initial=1, maximum=10)
+    delays = [backoff.next() for i in range(6)]
+    for delay, limit in zip(delays, [1, 2, 4, 8, 10, 10]):
+        assert limit / 2 <= delay <= limit
+
+    backoff.reset()
+    assert backoff.next() <= 1
+
+
+def test_run_backs_off_on_api_errors(client, monkeypatch, k8s_api, k8s_client):
+    create_identity(client, 'ca', 'ca-tls')
+    delays = []
+
+    def sleep(delay):
+        delays.append(delay)
+        if len(delays) == 3:
+            raise KeyboardInterrupt
+
+    k8s_api.fail_next(2, 503)
+    monkeypatch.setattr(k8s.Client, 'from_config', classmethod(lambda cls: k8s_client))
+    monkeypatch.setattr(k8s.time, 'sleep', sleep)
+    monkeypatch.setattr(k8s.random, 'uniform', lambda a, b: 1)
+    with pytest.raises(KeyboardInterrupt):
+        k8s.run(interval=30)
+    assert delays == [1, 2, 30]
+    assert ('default', 'ca-tls') in k8s_api.secrets
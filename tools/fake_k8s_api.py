@@ -0,0 +1,203 @@
+import re
+import sys
+import json
+import time
+import uuid
+import base64
+import random
+import argparse
+import binascii
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SECRET_PATH_RE = re.compile(r'^/api/v1/namespaces/([^/]+)/secrets(?:/([^/]+))?/?$')
+
+
+def merge_patch(target, patch):
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+class ApiException(Exception):
+    def __init__(self, code, reason, message):
+        super().__init__(message)
+        self.code = code
+        self.reason = reason
+
+
+# in-memory stand-in for the Secrets part of the Kubernetes API
+class FakeApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    quiet = True
+
+    def __init__(self, address=('127.0.0.1', 0), token=None, fail_rate=0, latency=0):
+        super().__init__(address, Handler)
+        self.token = token
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self.secrets = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        self._fail_next = []
+        self._resource_version = 0
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address[:2])
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='fake-k8s-api', daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def fail_next(self, count, code=503):
+        with self.lock:
+            self._fail_next += [code] * count
+
+    def get_secret(self, namespace, name):
+        secret = self.secrets.get((namespace, name))
+        return secret and {k: base64.b64decode(v) for k, v in secret.get('data', {}).items()}
+
+    def handle_api(self, method, path, body, content_type):
+        with self.lock:
+            self.requests.append((method, path))
+            if self._fail_next:
+                code = self._fail_next.pop(0)
+                raise ApiException(code, 'InternalError', 'injected failure')
+        if self.fail_rate and random.random() < self.fail_rate:
+            raise ApiException(503, 'ServiceUnavailable', 'injected failure')
+
+        match = SECRET_PATH_RE.match(path)
+        if not match:
+            raise ApiException(404, 'NotFound', 'the server could not find the requested resource')
+        namespace, name = match.groups()
+
+        with self.lock:
+            if name is None:
+                if method == 'GET':
+                    items = [s for (ns, _), s in sorted(self.secrets.items()) if ns == namespace]
+                    return 200, {'kind': 'SecretList', 'apiVersion': 'v1', 'items': items}
+                if method == 'POST':
+                    return 201, self.create(namespace, body)
+                raise ApiException(405, 'MethodNotAllowed', 'method not allowed')
+
+            secret = self.secrets.get((namespace, name))
+            if method == 'POST':
+                raise ApiException(405, 'MethodNotAllowed', 'method not allowed')
+            if secret is None:
+                raise ApiException(404, 'NotFound', 'secrets "{}" not found'.format(name))
+            if method == 'GET':
+                return 200, secret
+            if method == 'DELETE':
+                del self.secrets[(namespace, name)]
+                return 200, {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Success'}
+            if method == 'PUT':
+                return 200, self.store(namespace, name, body, secret)
+            if method == 'PATCH':
+                if content_type != 'application/merge-patch+json':
+                    raise ApiException(415, 'UnsupportedMediaType',
+                                       'the body of the request was in an unknown format')
+                return 200, self.store(namespace, name, merge_patch(secret, body), secret)
+            raise ApiException(405, 'MethodNotAllowed', 'method not allowed')
+
+    def create(self, namespace, body):
+        metadata = body.get('metadata') or {}
+        name = metadata.get('name')
+        if not name:
+            raise ApiException(422, 'Invalid', 'metadata.name: Required value')
+        if (namespace, name) in self.secrets:
+            raise ApiException(409, 'AlreadyExists', 'secrets "{}" already exists'.format(name))
+        return self.store(namespace, name, body)
+
+    def store(self, namespace, name, secret, previous=None):
+        if previous and secret.get('type', 'Opaque') != previous.get('type', 'Opaque'):
+            raise ApiException(422, 'Invalid', 'type: Invalid value: field is immutable')
+        for key, value in (secret.get('data') or {}).items():
+            try:
+                base64.b64decode(value, validate=True)
+            except (binascii.Error, TypeError):
+                raise ApiException(422, 'Invalid', 'data[{}]: Invalid value: illegal base64 data'.format(key))
+
+        self._resource_version += 1
+        metadata = dict(secret.get('metadata') or {}, name=name, namespace=namespace,
+                        resourceVersion=str(self._resource_version))
+        metadata['uid'] = previous['metadata']['uid'] if previous else str(uuid.uuid4())
+        secret = dict(secret, apiVersion='v1', kind='Secret', metadata=metadata)
+        secret.setdefault('type', 'Opaque')
+        self.secrets[(namespace, name)] = secret
+        return secret
+
+
+class Handler(BaseHTTPRequestHandler):
+    def handle_request(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.token and self.headers.get('Authorization') != 'Bearer ' + self.server.token:
+            return self.respond(401, status_body(401, 'Unauthorized', 'Unauthorized'))
+
+        body = None
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            try:
+                body = json.loads(self.rfile.read(length).decode('utf-8'))
+            except ValueError:
+                return self.respond(400, status_body(400, 'BadRequest', 'invalid JSON body'))
+
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip()
+        try:
+            code, data = self.server.handle_api(self.command, self.path.split('?')[0], body, content_type)
+        except ApiException as e:
+            code, data = e.code, status_body(e.code, e.reason, str(e))
+        self.respond(code, data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_request
+
+    def respond(self, code, data):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, fmt, *args):
+        if not self.server.quiet:
+            super().log_message(fmt, *args)
+
+
+def status_body(code, reason, message):
+    return {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure', 'message': message, 'reason': reason,
+            'code': code}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake Kubernetes Secrets API for local k8s-sync runs')
+    parser.add_argument('-b', '--bind', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('-p', '--port', type=int, default=8001, help='Port to listen on')
+    parser.add_argument('-t', '--token', default=None, help='Require this bearer token')
+    parser.add_argument('--fail-rate', type=float, default=0, help='Fraction of requests failed with 503')
+    parser.add_argument('--latency', type=float, default=0, help='Seconds added to every response')
+    args = parser.parse_args()
+
+    server = FakeApiServer((args.bind, args.port), token=args.token, fail_rate=args.fail_rate, latency=args.latency)
+    server.quiet = False
+    print('Serving fake Kubernetes API on {}'.format(server.url), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()